@@ -0,0 +1,70 @@
+# bench/bench_chunk.py
+"""
+チャンク分割のスループット計測
+100k セグメントの合成字幕で、以前の実装（1セグメントずつ encode）と
+summarizer._chunk（キャッシュ済みエンコーダ＋一括 encode）を比較する
+tiktoken のエンコーダを読み込めない環境では、他のベンチと同じく fakes.FakeEncoder で計測する
+
+    python bench/bench_chunk.py --segments 100000 --limit 8000 --overlap 200
+"""
+import sys, pathlib
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import argparse, random, time
+from summarizer import _chunk
+import tokens
+
+WORDS = ["今日は", "皆さん", "機械学習", "について", "説明", "します", "the", "model", "is", "trained", "on", "data"]
+
+
+def make_transcript(n: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    return [
+        {"text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))),
+         "start": i * 2.0, "duration": 2.0}
+        for i in range(n)
+    ]
+
+
+def legacy_chunk(transcript: list[dict], limit_tokens: int) -> list[str]:
+    """比較用: 以前の summarizer._chunk の実装そのまま"""
+    # tiktoken.get_encoding の代わり（fakes.tokenizer_name で差し替えられるよう tokens 経由で取る）
+    enc = tokens.get_encoder()
+    buf, tok, out = [], 0, []
+    for seg in transcript:
+        t = enc.encode(seg["text"])
+        if tok + len(t) > limit_tokens and buf:
+            out.append(" ".join(buf))
+            buf, tok = [], 0
+        buf.append(seg["text"])
+        tok += len(t)
+    if buf:
+        out.append(" ".join(buf))
+    return out
+
+
+def measure(label: str, fn, n: int, repeat: int = 3) -> float:
+    fn()  # エンコーダの読み込みなどを除くためのウォームアップ
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        chunks = fn()
+        best = min(best, time.perf_counter() - started)
+    print(f"{label:<24} {best:8.3f} s  {n / best:>12,.0f} seg/s  chunks {len(chunks):>6}")
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segments", type=int, default=100_000)
+    parser.add_argument("--limit", type=int, default=8000, help="チャンクあたりのトークン上限")
+    parser.add_argument("--overlap", type=int, default=0, help="チャンク間で重ねるトークン数")
+    args = parser.parse_args()
+
+    # fakes は make_transcript をこのモジュールから読むので、ここで遅れて import する
+    from fakes import tokenizer_name
+    print(f"tokenizer: {tokenizer_name()}")
+    tr = make_transcript(args.segments)
+    legacy = measure("legacy _chunk", lambda: legacy_chunk(tr, args.limit), args.segments)
+    new = measure("_chunk", lambda: _chunk(tr, args.limit, args.overlap), args.segments)
+    print(f"speedup: {legacy / new:.2f}x")
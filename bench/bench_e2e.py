@@ -0,0 +1,244 @@
+# bench/bench_e2e.py
+"""
+オフラインのエンドツーエンド・ベンチマーク
+YouTubeTranscriptApi / yt-dlp / Gemini を bench/fakes.py の代替品に差し替え、
+parse_vtt・_chunk・summarize・main.run のレイテンシ（p50/p90/p99）とスループットを
+字幕サイズごとに計測する。ネットワークも API キーも不要
+
+    python bench/bench_e2e.py                                   # 計測して表示
+    python bench/bench_e2e.py --baseline bench/baseline.json    # 基準値と比較（悪化なら exit 1）
+    python bench/bench_e2e.py --update-baseline                 # 基準値を書き換える
+    python bench/bench_e2e.py --api-latency 0.3 --api-failure-rate 0.2 --llm-latency 1.5
+
+比較は各ケースの p50 で行い、基準値より --threshold（既定 25%）以上、かつ --noise-floor（既定 1 ms）以上
+遅ければ回帰とみなす（1 ms 前後のケースは割合だけだと揺らぎで簡単に超えるため）
+p50 はマシンの速さをならすため、同じ実行で測った較正用の処理（calibrate）の時間との比で比べる
+トークナイザ・代替品の設定・Python のバージョンなど計測条件が基準値と違うときは比較しない（exit 2）
+"""
+import sys, pathlib
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import argparse, contextlib, io, json, logging, os, platform, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+
+# キャッシュは使い捨てのディレクトリに向ける（cache を import する前に設定する）
+os.environ.setdefault("YT_SUMMARIZER_CACHE_DIR", tempfile.mkdtemp(prefix="yt-bench-"))
+
+from fakes import Corpus, FakeModel, FakeTranscriptApi, FakeYoutubeDL, Profile, installed, tokenizer_name
+import transcript
+from transcript import parse_vtt
+from summarizer import _chunk, summarize, CHUNK_TOKENS
+import main
+
+BASELINE = pathlib.Path(__file__).with_name("baseline.json")
+
+# 字幕サイズ（セグメント数）: 10分・1時間・5時間程度の動画に相当
+SIZES = {"small": 300, "medium": 1800, "large": 9000}
+
+
+# 1ケースあたりの計測時間の目安（秒）と、そのために増やす回数の上限
+MIN_CASE_SECONDS = 0.3
+MAX_REPEAT = 1000
+
+# 計測条件のうち、違うと数値を比べられないもの
+COMPARABLE_META = ("python", "machine", "tokenizer", "fakes", "repeat", "concurrency")
+
+
+def calibrate(rounds: int = 7) -> list[float]:
+    """
+    マシンの速さの目安。計測対象のコードを使わない固定の処理を rounds 回測った時間（秒）のリスト
+    各ケースの p50 をこの中央値で割った値（relative_p50）を基準値との比較に使う
+    """
+    data = [{"start": i * 1.5, "text": f"セグメント {i}"} for i in range(2000)]
+    times = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        json.loads(json.dumps(data, ensure_ascii=False))
+        sum(i * i for i in range(300_000))
+        "".join(sorted(d["text"] for d in data))
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def meta_mismatch(meta: dict, base_meta: dict) -> list[str]:
+    """基準値と計測条件が違う項目を返す"""
+    return [f"{key}: {base_meta.get(key)!r} → {meta.get(key)!r}"
+            for key in COMPARABLE_META if base_meta.get(key) != meta.get(key)]
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def measure(fn, repeat: int, concurrency: int = 1, warmup: int = 1, min_time: float = MIN_CASE_SECONDS) -> dict:
+    """
+    fn を repeat 回（concurrency 並列で）呼び、1回ごとのレイテンシと全体のスループットを返す
+    速いケースは少ない回数だと p50 が揺れるので、合計がおよそ min_time 秒になるまで回数を増やす
+    失敗率を指定した代替品で fn が例外を投げても止めず、errors に数える
+    """
+    errors = []
+
+    def once():
+        started = time.perf_counter()
+        try:
+            fn()
+        except Exception:
+            errors.append(1)
+        latencies.append(time.perf_counter() - started)
+
+    latencies = []
+    for _ in range(warmup):
+        once()
+    if latencies:
+        repeat = max(repeat, min(MAX_REPEAT, int(min_time / max(min(latencies), 1e-6))))
+    latencies.clear()
+    errors.clear()
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        for _ in range(repeat):
+            once()
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as ex:
+            for f in [ex.submit(once) for _ in range(repeat)]:
+                f.result()
+    elapsed = time.perf_counter() - started
+    return {
+        "p50": percentile(latencies, 0.50),
+        "p90": percentile(latencies, 0.90),
+        "p99": percentile(latencies, 0.99),
+        "mean": sum(latencies) / len(latencies),
+        "ops_per_sec": repeat / elapsed,
+        "errors": len(errors),
+    }
+
+
+def run_cases(args, corpus: Corpus, api: FakeTranscriptApi, ydl: FakeYoutubeDL) -> dict:
+    results = {}
+    for name, segments in SIZES.items():
+        vid = f"bench{name:0>6}"[:11]
+        vtt = corpus.vtt(vid).decode("utf-8")
+        tr = corpus.transcript(vid)
+        repeat = max(3, args.repeat * SIZES["small"] // segments)
+
+        results[f"parse_vtt/{name}"] = measure(lambda: parse_vtt(vtt), repeat)
+        results[f"chunk/{name}"] = measure(lambda: _chunk(tr, CHUNK_TOKENS), repeat)
+        results[f"summarize/{name}"] = measure(
+            lambda: summarize(tr, use_cache=False), repeat, args.concurrency)
+
+        # main.run は進捗を print するので捨てる
+        def run_once():
+            with contextlib.redirect_stdout(io.StringIO()):
+                main.run(f"https://youtu.be/{vid}", "auto", use_cache=False)
+        results[f"run/{name}"] = measure(run_once, repeat, args.concurrency)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, noise_floor: float, calibration: float) -> list[str]:
+    """
+    基準値より relative_p50（較正処理の時間との比）が threshold 以上悪化したケースを返す
+    ただし今回のマシンの速さに換算した差が noise_floor 秒に満たないものは揺らぎとみなして除く
+    """
+    regressions = []
+    for case, base in baseline.get("cases", {}).items():
+        if case not in results:
+            continue
+        now, before = results[case]["relative_p50"], base["relative_p50"]
+        if before > 0 and now > before * (1 + threshold) and (now - before) * calibration >= noise_floor:
+            regressions.append(f"{case}: relative p50 {before:.2f} → {now:.2f} (+{now / before - 1:.0%}, "
+                               f"+{(now - before) * calibration * 1000:.2f} ms)")
+    return regressions
+
+
+def print_table(results: dict, baseline: dict | None):
+    cases = (baseline or {}).get("cases", {})
+    print(f"{'case':<20} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'ops/s':>10} {'errors':>7} {'vs base':>9}")
+    for case, r in results.items():
+        diff = ""
+        if case in cases and cases[case]["relative_p50"] > 0:
+            diff = f"{r['relative_p50'] / cases[case]['relative_p50'] - 1:+.0%}"
+        print(f"{case:<20} {r['p50'] * 1000:10.2f} {r['p90'] * 1000:10.2f} {r['p99'] * 1000:10.2f} "
+              f"{r['ops_per_sec']:10.1f} {r['errors']:7d} {diff:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=30, help="small での繰り返し回数（大きいサイズほど減らす）")
+    parser.add_argument("--concurrency", type=int, default=1, help="summarize / run を同時に呼ぶ数")
+    parser.add_argument("--api-latency", type=float, default=0.0)
+    parser.add_argument("--api-failure-rate", type=float, default=0.0)
+    parser.add_argument("--ytdlp-latency", type=float, default=0.0)
+    parser.add_argument("--ytdlp-failure-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.2, help="レイテンシの揺らぎ（割合）")
+    parser.add_argument("--hedge-delay", type=float, default=None, help="yt-dlp を並走させるまでの秒数（既定は自動調整）")
+    parser.add_argument("--baseline", default=None, help="比較する基準値ファイル")
+    parser.add_argument("--update-baseline", action="store_true", help=f"結果を基準値として保存（既定 {BASELINE.name}）")
+    parser.add_argument("--threshold", type=float, default=0.25, help="回帰とみなす p50 の悪化率")
+    parser.add_argument("--noise-floor", type=float, default=1.0, help="回帰とみなす p50 の最小の悪化（ミリ秒）")
+    parser.add_argument("--json", default=None, help="結果を JSON で書き出すファイル")
+    parser.add_argument("--verbose", action="store_true", help="パイプラインのログを表示する")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        # 失敗率を上げると警告ログが大量に出るので抑える
+        logging.disable(logging.CRITICAL)
+    if args.hedge_delay is not None:
+        transcript.TRANSCRIPT_HEDGE_DELAY = str(args.hedge_delay)
+
+    corpus = Corpus({f"bench{name:0>6}"[:11]: n for name, n in SIZES.items()})
+    api = FakeTranscriptApi(corpus, Profile(args.api_latency, args.jitter, args.api_failure_rate))
+    ydl = FakeYoutubeDL(corpus, Profile(args.ytdlp_latency, args.jitter, args.ytdlp_failure_rate))
+    model = FakeModel(Profile(args.llm_latency, args.jitter, args.llm_failure_rate))
+    tokenizer = tokenizer_name()
+    if tokenizer == "fake":
+        print("※ tiktoken のエンコーダを読み込めないため近似トークナイザで計測します", file=sys.stderr)
+
+    # 較正は計測の前後で測り、その中央値を使う（途中の負荷の変化をならす）
+    calibration = calibrate()
+    with installed(api=api, ydl=ydl, model=model):
+        results = run_cases(args, corpus, api, ydl)
+    calibration = percentile(calibration + calibrate(), 0.50)
+    for r in results.values():
+        r["relative_p50"] = r["p50"] / calibration
+
+    meta = {
+        "python": ".".join(platform.python_version_tuple()[:2]),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "tokenizer": tokenizer,
+        "fakes": {k: v for k, v in vars(args).items() if k.endswith(("latency", "failure_rate")) or k == "jitter"},
+        "repeat": args.repeat,
+        "concurrency": args.concurrency,
+        "calibration": calibration,
+    }
+    baseline = None
+    baseline_path = pathlib.Path(args.baseline) if args.baseline else BASELINE
+    if baseline_path.exists() and not args.update_baseline:
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+        mismatch = meta_mismatch(meta, baseline.get("meta", {}))
+        if mismatch:
+            print("※ 基準値と計測条件が異なるため比較しません（--update-baseline で取り直してください）", file=sys.stderr)
+            for line in mismatch:
+                print(f"  {line}", file=sys.stderr)
+            if args.baseline:
+                print_table(results, None)
+                sys.exit(2)
+            baseline = None
+
+    print_table(results, baseline)
+    print(f"caption API calls {api.calls} / yt-dlp calls {ydl.calls} / LLM calls {model.calls}")
+
+    if args.json:
+        pathlib.Path(args.json).write_text(json.dumps({"meta": meta, "cases": results}, indent=2), encoding="utf-8")
+    if args.update_baseline:
+        baseline_path.write_text(json.dumps({"meta": meta, "cases": results}, indent=2) + "\n", encoding="utf-8")
+        print(f"✓ 基準値を更新: {baseline_path}")
+        sys.exit(0)
+    if args.baseline:
+        regressions = compare(results, baseline or {}, args.threshold, args.noise_floor / 1000, calibration)
+        for line in regressions:
+            print(f"✗ regression {line}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,46 @@
+# bench/bench_import.py
+"""
+起動時間の計測: 新しいインタプリタで `import main` にかかる時間
+Streamlit は操作のたびにスクリプトを再実行するので、ここが重いと毎回効く
+
+    python bench/bench_import.py --runs 10 --top 15
+"""
+import argparse, os, pathlib, re, statistics, subprocess, sys, time
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+
+def time_import(module: str) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=ROOT, check=True)
+    return time.perf_counter() - started
+
+
+def import_profile(module: str, top: int) -> list[tuple[int, str]]:
+    """-X importtime の出力から累積時間の大きいモジュールを返す"""
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         cwd=ROOT, capture_output=True, text=True, check=True)
+    rows = []
+    for line in res.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)", line)
+        # 最上位（インデントの浅い）モジュールだけを見る
+        if m and len(m.group(2)) <= 3:
+            rows.append((int(m.group(1)), m.group(3)))
+    return sorted(rows, reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    baseline = statistics.median(time_import("sys") for _ in range(args.runs))
+    times = [time_import(args.module) for _ in range(args.runs)]
+    print(f"python 起動のみ      : {baseline * 1000:8.1f} ms")
+    print(f"import {args.module:<13}: {statistics.median(times) * 1000:8.1f} ms (median of {args.runs}), "
+          f"min {min(times) * 1000:.1f} ms")
+    print(f"\n累積 import 時間の上位 {args.top}:")
+    for us, name in import_profile(args.module, args.top):
+        print(f"  {us / 1000:8.1f} ms  {name}")
@@ -0,0 +1,107 @@
+# bench/bench_pipeline.py
+"""
+段階ごとの処理（字幕を全部取得 → summarize）と pipeline.summarize_streaming の比較
+非常に長い合成 VTT を指定の帯域で少しずつ返す疑似ダウンロードから要約までを通し、
+ピークメモリ（tracemalloc）と最初の部分要約までの時間・全体の時間を表示する
+Gemini は bench/fakes.py の FakeModel を使う
+
+    python bench/bench_pipeline.py --hours 24 --bandwidth 4
+"""
+import sys, pathlib
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import argparse, gc, io, logging, os, tempfile, time, tracemalloc
+
+os.environ.setdefault("YT_SUMMARIZER_CACHE_DIR", tempfile.mkdtemp(prefix="yt-bench-"))
+
+from bench_vtt import iter_vtt_lines
+from fakes import Corpus, FakeModel, FakeYoutubeDL, Profile, installed, tokenizer_name
+import pipeline, summarizer, transcript
+
+
+class VTTStream(io.RawIOBase):
+    """合成 VTT を生成しながら返す読み出し専用ストリーム。bandwidth（MB/s）で受信の速さを真似る"""
+
+    def __init__(self, hours: float, bandwidth: float):
+        self.lines = iter_vtt_lines(hours)
+        self.bandwidth = bandwidth * 1024 * 1024
+        self.pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while len(self.pending) < len(b):
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.pending += line.encode("utf-8") + b"\n"
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        if n and self.bandwidth > 0:
+            time.sleep(n / self.bandwidth)
+        return n
+
+
+class StreamingYoutubeDL(FakeYoutubeDL):
+    def __init__(self, hours: float, bandwidth: float):
+        super().__init__(Corpus({}))
+        self.hours = hours
+        self.bandwidth = bandwidth
+
+    def urlopen(self, url: str):
+        return io.BufferedReader(VTTStream(self.hours, self.bandwidth), buffer_size=64 * 1024)
+
+
+class TimedModel(FakeModel):
+    """最初の呼び出しが終わった時刻（= 最初の部分要約ができた時刻）を記録する"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.first_done = None
+
+    def generate_content(self, content: str, stream: bool = False, request_options=None):
+        res = super().generate_content(content, stream=stream, request_options=request_options)
+        if self.first_done is None:
+            self.first_done = time.perf_counter()
+        return res
+
+
+def staged(video_id: str) -> str:
+    tr = transcript.get_transcript_with_ytdlp(video_id)
+    return summarizer.summarize(tr, use_cache=False, mode="map_reduce")
+
+
+def streaming(video_id: str) -> str:
+    return pipeline.summarize_streaming(video_id, use_cache=False)
+
+
+def measure(label: str, fn, model: TimedModel):
+    gc.collect()
+    model.first_done = None
+    tracemalloc.start()
+    started = time.perf_counter()
+    fn("dQw4w9WgXcQ")
+    total = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    first = (model.first_done or started) - started
+    print(f"{label:<10} peak {peak / 1024 / 1024:8.1f} MiB  first partial {first:7.2f} s  "
+          f"total {total:7.2f} s  llm calls {model.calls}")
+    model.calls = 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=24, help="合成する VTT の長さ（時間）")
+    parser.add_argument("--bandwidth", type=float, default=4, help="疑似ダウンロードの帯域（MB/s、0 で無制限）")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="LLM 呼び出し1回の待ち（秒）")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    print(f"tokenizer: {tokenizer_name()}, VTT: {args.hours} h, bandwidth: {args.bandwidth} MB/s")
+    model = TimedModel(Profile(args.llm_latency))
+    with installed(ydl=StreamingYoutubeDL(args.hours, args.bandwidth), model=model):
+        measure("staged", staged, model)
+        measure("streaming", streaming, model)
@@ -0,0 +1,69 @@
+# bench/bench_presets.py
+"""
+複数プリセットの要約: プリセットごとに summarize() を順に呼ぶ場合と summarize_many() の比較
+Gemini は bench/fakes.py の FakeModel（入力の長さに比例した待ち付き）とコンテキストキャッシュの代替品を使う
+
+    python bench/bench_presets.py --segments 2000 --llm-latency 1.0 --per-1k-tokens 0.05
+    python bench/bench_presets.py --segments 9000   # 長尺: 部分要約を1回だけ作って使い回す
+"""
+import sys, pathlib
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import argparse, logging, os, tempfile, time
+
+os.environ.setdefault("YT_SUMMARIZER_CACHE_DIR", tempfile.mkdtemp(prefix="yt-bench-"))
+
+from fakes import Corpus, FakeContextCache, FakeModel, Profile, installed, tokenizer_name
+import summarizer
+
+PRESETS = {
+    "standard": "要点を箇条書きでまとめてください。",
+    "three_lines": "3行以内で要約してください。",
+    "english": "Summarize in exactly five English bullet points.",
+    "timeline": "時系列に沿って箇条書きにしてください。",
+}
+
+
+class CountingModel(FakeModel):
+    """送られた入力の文字数を数える"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.input_chars = 0
+
+    def generate_content(self, content: str, stream: bool = False, request_options=None):
+        self.input_chars += len(content)
+        return super().generate_content(content, stream=stream, request_options=request_options)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segments", type=int, default=2000)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="1回の呼び出しの固定の待ち（秒）")
+    parser.add_argument("--per-1k-tokens", type=float, default=0.05, help="入力 1k トークンあたりの待ち（秒）")
+    parser.add_argument("--context-min-tokens", type=int, default=summarizer.CONTEXT_CACHE_MIN_TOKENS)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    tokenizer_name()
+    summarizer.CONTEXT_CACHE_MIN_TOKENS = args.context_min_tokens
+    tr = Corpus({"x": args.segments}).transcript("x")
+    model = CountingModel(Profile(args.llm_latency), per_1k_tokens=args.per_1k_tokens)
+    context = FakeContextCache(model)
+
+    with installed(model=model, context_cache=context):
+        started = time.perf_counter()
+        for prompt in PRESETS.values():
+            summarizer.summarize(tr, prompt=prompt, use_cache=False)
+        sequential = time.perf_counter() - started
+        sequential_chars, model.input_chars = model.input_chars, 0
+
+        started = time.perf_counter()
+        summarizer.summarize_many(tr, PRESETS, use_cache=False)
+        fanout = time.perf_counter() - started
+
+    print(f"presets: {len(PRESETS)}, segments: {args.segments:,}")
+    print(f"{'sequential summarize':<24} {sequential:8.2f} s  input {sequential_chars:>10,} chars")
+    print(f"{'summarize_many':<24} {fanout:8.2f} s  input {model.input_chars:>10,} chars  "
+          f"(context caches created {context.created}, deleted {context.deleted})")
+    print(f"speedup: {sequential / fanout:.2f}x")
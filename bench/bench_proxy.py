@@ -0,0 +1,151 @@
+# bench/bench_proxy.py
+"""
+ProxyPool をローカルの代替プロキシ（HTTP サーバ）に対して動かして確認する
+・keep-alive: 同じプロキシへのヘルスチェック・Transcript API の取得が1本の接続を使い回すか
+・EWMA: 速いプロキシが遅いプロキシより先に並ぶか
+・サーキット: 407 / 429 が続いたら開き、クールダウン後の1回（半開）で成功すれば閉じ、失敗すれば開き直すか
+・有料プロキシ: 正常なら必ず有料プロキシを使い、サーキットが開いたときだけ他に回すか
+確認に失敗したら終了コード 1
+
+    python bench/bench_proxy.py
+"""
+import sys, pathlib
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging, threading, time
+
+from proxy_utils import ProxyPool
+
+PROBE_URL = "http://probe.invalid/generate_204"
+
+
+class StandInProxy:
+    """
+    どの URL にも status を返す HTTP サーバ。プロキシとして指定すると転送せずに自分で答える
+    受けたリクエスト数と、使われた接続（クライアントのポート）の数を数える
+    """
+
+    def __init__(self, status: int = 204, delay: float = 0.0):
+        self.status = status
+        self.delay = delay
+        self.requests = 0
+        self.connections = set()
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                owner.requests += 1
+                owner.connections.add(self.client_address)
+                time.sleep(owner.delay)
+                self.send_response(owner.status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_pool(proxies: list[StandInProxy], **kwargs) -> ProxyPool:
+    return ProxyPool([p.url for p in proxies], paid_proxy=None, source_url=None,
+                     probe_url=PROBE_URL, timeout=2, **kwargs)
+
+
+def state(pool: ProxyPool, proxy: StandInProxy):
+    return pool._proxies[proxy.url]
+
+
+failures = []
+
+
+def check(label: str, ok: bool, detail: str = ""):
+    print(f"{'✓' if ok else '✗'} {label}{f'  ({detail})' if detail else ''}")
+    if not ok:
+        failures.append(label)
+
+
+def check_keep_alive():
+    import transcript
+    server = StandInProxy()
+    pool = make_pool([server])
+    proxy = state(pool, server)
+    for _ in range(5):
+        pool.probe(proxy)
+    check("ヘルスチェックが接続を使い回す", server.requests == 5 and len(server.connections) == 1,
+          f"{server.requests} リクエスト / {len(server.connections)} 接続")
+    # Transcript API にもプロキシの Session がそのまま渡る
+    api = transcript._transcript_api(proxy)
+    check("Transcript API がプロキシの Session を使う", api._fetcher._http_client is proxy.session)
+    server.close()
+
+
+def check_ewma_order():
+    fast, slow = StandInProxy(delay=0.01), StandInProxy(delay=0.2)
+    pool = make_pool([slow, fast])
+    for _ in range(3):
+        pool.probe(state(pool, slow))
+        pool.probe(state(pool, fast))
+    ordered = [s["url"] for s in pool.stats()]
+    check("EWMA のレイテンシで速いプロキシが先に並ぶ", ordered == [fast.url, slow.url],
+          f"fast {state(pool, fast).latency:.3f}s / slow {state(pool, slow).latency:.3f}s")
+    picks = {pool.get().url for _ in range(20)}
+    check("get() は速いプロキシを返す", fast.url in picks)
+    fast.close()
+    slow.close()
+
+
+def check_paid_first():
+    paid, free = StandInProxy(), StandInProxy()
+    pool = ProxyPool([free.url], paid_proxy=paid.url, source_url=None,
+                     probe_url=PROBE_URL, timeout=2, failure_threshold=1)
+    picks = {pool.get().url for _ in range(30)}
+    check("正常な有料プロキシだけを使う", picks == {paid.url})
+    paid.status = 407
+    pool.probe(state(pool, paid))
+    picks = {pool.get().url for _ in range(30)}
+    check("有料プロキシのサーキットが開いたら他に回す", picks == {free.url})
+    paid.close()
+    free.close()
+
+
+def check_circuit(status: int):
+    server = StandInProxy(status=status)
+    pool = make_pool([server], failure_threshold=3, cooldown=0.3)
+    proxy = state(pool, server)
+    results = [pool.probe(proxy) for _ in range(3)]
+    check(f"{status} は失敗として数える", not any(results))
+    check(f"{status} が続くとサーキットが開く", proxy.opened_at is not None and pool.get() is None)
+
+    # クールダウン後は1件だけ通し（半開）、その1回が失敗すれば開き直す
+    time.sleep(0.35)
+    check("クールダウン後に半開で1回だけ通す", pool.get() is proxy and pool.get() is None)
+    pool.probe(proxy)
+    check("半開での失敗で開き直す", proxy.opened_at is not None and pool.get() is None)
+
+    # プロキシが直ったら、半開の1回の成功で閉じる
+    server.status = 204
+    time.sleep(0.35)
+    trial = pool.get()
+    ok = trial is proxy and pool.probe(proxy)
+    check("半開での成功でサーキットが閉じる", ok and proxy.opened_at is None and pool.get() is proxy)
+    server.close()
+
+
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+    check_keep_alive()
+    check_ewma_order()
+    check_paid_first()
+    for status in (407, 429):
+        check_circuit(status)
+    sys.exit(1 if failures else 0)
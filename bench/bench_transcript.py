@@ -0,0 +1,67 @@
+# bench/bench_transcript.py
+"""
+字幕の表現ごとのメモリ量とキャッシュ形式の比較
+list[dict]（従来）と segments.Transcript（配列＋1本のテキスト）について
+・保持に必要なメモリ（tracemalloc で計測）
+・キャッシュに書くバイト数と、書き出し／読み込みの時間（JSON と to_bytes / from_bytes）
+を合成した長時間の字幕で比べる
+
+    python bench/bench_transcript.py --segments 200000
+"""
+import sys, pathlib
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import argparse, gc, json, time, tracemalloc
+from bench_chunk import make_transcript
+from segments import Transcript
+
+
+def retained(build) -> tuple[object, int]:
+    """build() が返すオブジェクトを保持するのに使われているメモリ（バイト）"""
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size
+
+
+def best_time(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segments", type=int, default=200_000, help="セグメント数（2秒ごとなら 20万で約111時間）")
+    args = parser.parse_args()
+
+    # 生成元を保持したまま測らないよう、どちらも生成からやり直す
+    as_list, list_bytes = retained(lambda: make_transcript(args.segments))
+    tr, tr_bytes = retained(lambda: Transcript.from_segments(make_transcript(args.segments)))
+    assert tr == as_list
+
+    print(f"segments: {args.segments:,}")
+    print(f"{'memory list[dict]':<24} {list_bytes / 2**20:10.1f} MiB")
+    print(f"{'memory Transcript':<24} {tr_bytes / 2**20:10.1f} MiB  ({list_bytes / tr_bytes:.1f}x smaller)")
+
+    json_data = json.dumps(as_list, ensure_ascii=False).encode("utf-8")
+    packed = tr.to_bytes()
+    print(f"{'cache JSON':<24} {len(json_data) / 2**20:10.1f} MiB")
+    print(f"{'cache to_bytes':<24} {len(packed) / 2**20:10.1f} MiB  ({len(json_data) / len(packed):.1f}x smaller)")
+
+    rows = [
+        ("encode JSON", lambda: json.dumps(as_list, ensure_ascii=False).encode("utf-8")),
+        ("decode JSON", lambda: json.loads(json_data)),
+        ("encode to_bytes", tr.to_bytes),
+        ("decode from_bytes", lambda: Transcript.from_bytes(packed)),
+        ("join texts list[dict]", lambda: "\n".join(t["text"] for t in as_list)),
+        ("join texts Transcript", lambda: tr.joined("\n")),
+    ]
+    for label, fn in rows:
+        print(f"{label:<24} {best_time(fn) * 1000:10.1f} ms")
@@ -0,0 +1,173 @@
+# bench/bench_vtt.py
+"""
+VTT パーサのピークメモリの比較
+以前の実装（legacy_parse_vtt）と transcript.iter_vtt / parse_vtt を
+合成した長時間の自動字幕 VTT で比べる
+iter_vtt の利点はファイル（やレスポンス）から1行ずつ読めることで、全体を文字列で持たない分ピークメモリが小さい
+処理時間は以前の実装とほぼ同じ（速くするための変更ではない）なので、参考として並べて表示するだけ
+
+    python bench/bench_vtt.py --hours 10
+"""
+import sys, pathlib
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import argparse, gc, logging, tempfile, time, tracemalloc
+from transcript import iter_vtt, parse_vtt, time_to_seconds
+
+logger = logging.getLogger(__name__)
+
+WORDS = ["今日は", "皆さん", "それでは", "説明", "していきます", "ポイント", "大事な", "ところ", "です", "ね"]
+
+
+def make_vtt(hours: float, cue_seconds: float = 2.0) -> str:
+    """YouTube の自動字幕風（ローリング表示・単語タイミングタグ付き）の VTT を生成"""
+    return "\n".join(iter_vtt_lines(hours, cue_seconds))
+
+
+def iter_vtt_lines(hours: float, cue_seconds: float = 2.0):
+    """make_vtt と同じ内容を1行ずつ返す（全体を作らずに長大な VTT を流すとき用）"""
+    yield from ("WEBVTT", "Kind: captions", "Language: ja", "")
+    prev = ""
+    n = int(hours * 3600 / cue_seconds)
+    for i in range(n):
+        t = i * cue_seconds
+        words = [WORDS[(i * 7 + k) % len(WORDS)] for k in range(4)]
+        tagged = words[0] + "".join(
+            f"<{_fmt(t + 0.3 * (k + 1))}><c> {w}</c>" for k, w in enumerate(words[1:])
+        )
+        line = f"{' '.join(words)} {i}"
+        yield from (f"{_fmt(t)} --> {_fmt(t + cue_seconds)} align:start position:0%", prev or " ", tagged + f" {i}", "")
+        yield from (f"{_fmt(t + cue_seconds)} --> {_fmt(t + cue_seconds + 0.01)} align:start position:0%", line, " ", "")
+        prev = line
+
+
+def _fmt(t: float) -> str:
+    h, rem = divmod(t, 3600)
+    m, s = divmod(rem, 60)
+    return f"{int(h):02d}:{int(m):02d}:{s:06.3f}"
+
+
+def legacy_parse_vtt(content: str) -> list[dict]:
+    """比較用: 以前の transcript.parse_vtt の実装そのまま"""
+    lines = content.split('\n')
+    transcript = []
+    current_text = []
+    current_start = None
+    current_duration = None
+    
+    for line in lines:
+        line = line.strip()
+        
+        # WEBVTTヘッダーをスキップ
+        if line.startswith('WEBVTT') or not line:
+            continue
+            
+        if '-->' in line:
+            # タイムスタンプ行
+            try:
+                # タイムスタンプ部分だけを抽出
+                timestamp_part = line.split(' align:')[0] if ' align:' in line else line
+                start, end = timestamp_part.split(' --> ')
+                current_start = start
+                # 時間の差分を計算
+                start_sec = time_to_seconds(start)
+                end_sec = time_to_seconds(end)
+                current_duration = end_sec - start_sec
+            except Exception as e:
+                logger.error(f"タイムスタンプのパースエラー: {str(e)}")
+                continue
+                
+        elif line and current_start is not None:
+            # テキスト行
+            # 特殊なタグを除去
+            clean_text = line
+            # <c>タグを除去
+            clean_text = clean_text.replace('<c>', '').replace('</c>', '')
+            # 時間タグを除去
+            import re
+            clean_text = re.sub(r'<\d{2}:\d{2}:\d{2}\.\d{3}>', '', clean_text)
+            
+            if clean_text.strip():  # 空でない場合のみ追加
+                current_text.append(clean_text.strip())
+            
+            # 次の行が空行またはタイムスタンプの場合、現在のセグメントを保存
+            if not current_text:
+                continue
+                
+            # 重複を除去
+            unique_text = ' '.join(dict.fromkeys(current_text))
+            
+            transcript.append({
+                'text': unique_text,
+                'start': current_start,
+                'duration': current_duration if current_duration is not None else 0.0
+            })
+            current_text = []
+            current_start = None
+            current_duration = None
+    
+    # 最後のセグメントを処理
+    if current_text and current_start is not None:
+        # 重複を除去
+        unique_text = ' '.join(dict.fromkeys(current_text))
+        transcript.append({
+            'text': unique_text,
+            'start': current_start,
+            'duration': current_duration if current_duration is not None else 0.0
+        })
+    
+    # 重複するセグメントを除去
+    unique_transcript = []
+    seen_texts = set()
+    
+    for segment in transcript:
+        if segment['text'] not in seen_texts:
+            seen_texts.add(segment['text'])
+            unique_transcript.append(segment)
+    
+    return unique_transcript
+
+
+def measure(label: str, fn, repeat: int = 3):
+    """実行時間（repeat 回の最小値）と、別の1回で測ったピークメモリを表示し、ピークメモリ（バイト）を返す"""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+        del result
+    # tracemalloc は割り当てごとに重いので時間計測とは分ける
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    elapsed = min(times)
+    print(f"{label:<28} {elapsed:8.3f} s  peak {peak / 1e6:8.1f} MB  segments {len(result):>8}")
+    return peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=10.0, help="合成する動画の長さ（時間）")
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    content = make_vtt(args.hours)
+    print(f"VTT: {args.hours} h, {len(content) / 1e6:.1f} MB")
+    with tempfile.NamedTemporaryFile("w", suffix=".vtt", encoding="utf-8", delete=False) as f:
+        f.write(content)
+        path = f.name
+
+    legacy_peak = measure("legacy parse_vtt(str)", lambda: legacy_parse_vtt(content))
+    measure("parse_vtt(str)", lambda: parse_vtt(content))
+
+    def from_file():
+        with open(path, encoding="utf-8") as fh:
+            return list(iter_vtt(fh))
+
+    del content
+    file_peak = measure("iter_vtt(file)", from_file)
+    pathlib.Path(path).unlink()
+    print(f"peak memory iter_vtt(file) / legacy parse_vtt(str): {file_peak / legacy_peak:.2f}")
@@ -0,0 +1,75 @@
+# bench/bench_ytdlp.py
+"""
+本物の yt-dlp（YoutubeDL.urlopen）でローカルの HTTP サーバから VTT を受信して、
+get_transcript_with_ytdlp と pipeline の受信しながらのパースが最後まで読めるかを確かめる
+（yt-dlp の Response は読み切ると自分を閉じるので、BytesIO を返す代替品では見つからない不具合がある）
+メタデータの取得（extract_info）だけはローカルの URL を返すよう差し替える
+確認に失敗したら終了コード 1
+
+    python bench/bench_ytdlp.py
+"""
+import sys, pathlib
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging, os, tempfile, threading
+
+os.environ.setdefault("YT_SUMMARIZER_CACHE_DIR", tempfile.mkdtemp(prefix="yt-bench-"))
+
+from fakes import Corpus
+import pipeline, transcript
+
+SEGMENTS = 3000
+
+
+class VTTServer:
+    """どのパスにも同じ VTT を返す HTTP サーバ"""
+
+    def __init__(self, body: bytes):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/vtt")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/sub.vtt"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+failures = []
+
+
+def check(label: str, ok: bool, detail: str = ""):
+    print(f"{'✓' if ok else '✗'} {label}{f'  ({detail})' if detail else ''}")
+    if not ok:
+        failures.append(label)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+    server = VTTServer(Corpus({}, default_segments=SEGMENTS).vtt("local"))
+    ydl = transcript._get_extractor()
+    ydl.extract_info = lambda *args, **kwargs: {"subtitles": {"ja": [{"ext": "vtt", "url": server.url}]}}
+
+    tr = transcript.get_transcript_with_ytdlp("local")
+    check("get_transcript_with_ytdlp が最後まで読める", len(tr) == SEGMENTS, f"{len(tr)} セグメント")
+
+    source = pipeline.SegmentSource("local", use_cache=False)
+    try:
+        streamed = sum(1 for _ in source)
+        check("pipeline が受信しながら最後まで読める", streamed == SEGMENTS, f"{streamed} セグメント")
+        check("pipeline の読み直しも同じ内容", source.transcript() == tr)
+    finally:
+        source.close()
+    server.close()
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,263 @@
+# bench/fakes.py
+"""
+ネットワーク・API キー無しでパイプラインを動かすためのローカルの代替品
+・FakeTranscriptApi: YouTubeTranscriptApi の代わり（fetch で JSON の字幕を返す）
+・FakeYoutubeDL: yt-dlp の YoutubeDL の代わり（extract_info / urlopen で VTT を返す）
+・FakeModel: Gemini の GenerativeModel の代わり（register_backend で差し替え）
+・FakeContextCache: Gemini のコンテキストキャッシュの代わり（register_context_cache で差し替え）
+・FakeEncoder: tiktoken のエンコーダ定義を取得できない環境用の近似トークナイザ
+いずれもレイテンシ・揺らぎ・失敗率を指定でき、字幕の中身は動画 ID ごとのセグメント数から決定的に生成する
+"""
+import sys, pathlib
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+import io, random, threading, time
+
+from bench_chunk import make_transcript
+from bench_vtt import make_vtt
+
+
+class FakeFailure(Exception):
+    """代替品が失敗率に従って投げる例外"""
+
+
+@dataclass
+class Profile:
+    latency: float = 0.0        # 1回あたりの平均レイテンシ（秒）
+    jitter: float = 0.0         # レイテンシの揺らぎ（平均に対する割合、一様分布）
+    failure_rate: float = 0.0   # 失敗させる確率
+
+    def __post_init__(self):
+        self._rng = random.Random(0)
+        self._lock = threading.Lock()
+
+    def wait(self, label: str):
+        """レイテンシ分だけ待ち、失敗率に当たれば FakeFailure を投げる"""
+        with self._lock:
+            factor = 1 + self._rng.uniform(-self.jitter, self.jitter)
+            failed = self._rng.random() < self.failure_rate
+        if self.latency > 0:
+            time.sleep(max(0.0, self.latency * factor))
+        if failed:
+            raise FakeFailure(f"{label}: 疑似的な失敗")
+
+
+class Corpus:
+    """動画 ID → セグメント数。字幕（JSON / VTT）は初回に生成して使い回す"""
+
+    def __init__(self, videos: dict[str, int], default_segments: int = 300):
+        self.videos = dict(videos)
+        self.default_segments = default_segments
+
+    def segments(self, video_id: str) -> int:
+        return self.videos.get(video_id, self.default_segments)
+
+    def transcript(self, video_id: str) -> list[dict]:
+        # 呼び出し側が書き換えても次の取得に影響しないよう、毎回コピーを返す
+        return [dict(seg) for seg in _canned_transcript(self.segments(video_id))]
+
+    def vtt(self, video_id: str) -> bytes:
+        return _canned_vtt(self.segments(video_id))
+
+
+@lru_cache(maxsize=None)
+def _canned_transcript(segments: int) -> tuple[dict, ...]:
+    return tuple(make_transcript(segments))
+
+
+@lru_cache(maxsize=None)
+def _canned_vtt(segments: int) -> bytes:
+    # make_vtt は 2 秒ごとに（ローリング表示分を含めて）1セグメント
+    return make_vtt(segments * 2.0 / 3600).encode("utf-8")
+
+
+class FakeTranscriptApi:
+    def __init__(self, corpus: Corpus, profile: Profile | None = None):
+        self.corpus = corpus
+        self.profile = profile or Profile()
+        self.calls = 0
+        self.http_client = None
+
+    def __call__(self, proxy_config=None, http_client=None):
+        # transcript.YouTubeTranscriptApi をこのインスタンスで置き換えるので、生成の呼び出しは自分を返す
+        self.http_client = http_client
+        return self
+
+    def fetch(self, video_id: str, languages=None, preserve_formatting: bool = False) -> "_Fetched":
+        self.calls += 1
+        self.profile.wait("caption API")
+        return _Fetched(self.corpus.transcript(video_id))
+
+
+class _Fetched(list):
+    def to_raw_data(self) -> list[dict]:
+        return list(self)
+
+
+class FakeYoutubeDL:
+    def __init__(self, corpus: Corpus, profile: Profile | None = None):
+        self.corpus = corpus
+        self.profile = profile or Profile()
+        self.calls = 0
+
+    def extract_info(self, url: str, download: bool = False, process: bool = True) -> dict:
+        self.calls += 1
+        self.profile.wait("yt-dlp")
+        video_id = url.rsplit("v=", 1)[-1]
+        return {
+            "id": video_id,
+            "subtitles": {"ja": [{"ext": "vtt", "url": f"fake://{video_id}.vtt"}]},
+            "automatic_captions": {},
+        }
+
+    def urlopen(self, url: str):
+        video_id = url.removeprefix("fake://").removesuffix(".vtt")
+        return io.BytesIO(self.corpus.vtt(video_id))
+
+
+class _Usage:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, text: str, usage: _Usage | None = None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class FakeModel:
+    """
+    generate_content(content, stream=..., request_options=...) だけを持つモデル
+    入力の長さに比例した待ち（per_1k_tokens）も足せる。stream=True では chunks 回に分けて返す
+    """
+
+    def __init__(self, profile: Profile | None = None, per_1k_tokens: float = 0.0,
+                 output: str = "・要点1\n・要点2\n・要点3", chunks: int = 4):
+        self.profile = profile or Profile()
+        self.per_1k_tokens = per_1k_tokens
+        self.output = output
+        self.chunks = chunks
+        self.calls = 0
+
+    def _usage(self, content: str) -> _Usage:
+        # 正確さは不要なので文字数から大まかに見積もる
+        return _Usage(len(content) // 2, len(self.output) // 2)
+
+    def generate_content(self, content: str, stream: bool = False, request_options=None):
+        self.calls += 1
+        self.profile.wait("LLM")
+        if self.per_1k_tokens > 0:
+            time.sleep(self.per_1k_tokens * len(content) / 2000)
+        if not stream:
+            return FakeResponse(self.output, self._usage(content))
+        return self._stream(content)
+
+    def _stream(self, content: str):
+        size = max(1, -(-len(self.output) // self.chunks))
+        parts = [self.output[i:i + size] for i in range(0, len(self.output), size)]
+        for i, part in enumerate(parts):
+            if i:
+                time.sleep(self.profile.latency / self.chunks)
+            yield FakeResponse(part, self._usage(content) if i == len(parts) - 1 else None)
+
+
+class _BoundModel:
+    """コンテキスト（字幕）を前提に持つモデル。送られるのはプロンプトだけになる"""
+
+    def __init__(self, model: FakeModel, context: str):
+        self.model = model
+        self.context = context
+
+    def generate_content(self, content: str, stream: bool = False, request_options=None):
+        return self.model.generate_content(content, stream=stream, request_options=request_options)
+
+
+class FakeContextCache:
+    """register_context_cache に渡す factory。作成・削除の回数を数える"""
+
+    def __init__(self, model: FakeModel, profile: Profile | None = None):
+        self.model = model
+        self.profile = profile or Profile()
+        self.created = 0
+        self.deleted = 0
+
+    def __call__(self, text: str):
+        self.profile.wait("context cache")
+        self.created += 1
+        return _BoundModel(self.model, text), self._delete
+
+    def _delete(self):
+        self.deleted += 1
+
+
+class FakeEncoder:
+    """tiktoken の代わり。UTF-8 で約3バイトを1トークンとみなす"""
+
+    def encode_ordinary(self, text: str) -> list[int]:
+        data = text.encode("utf-8")
+        return [data[i] for i in range(0, len(data), 3)]
+
+    def encode(self, text: str, **kwargs) -> list[int]:
+        return self.encode_ordinary(text)
+
+    def encode_ordinary_batch(self, texts: list[str], **kwargs) -> list[list[int]]:
+        return [self.encode_ordinary(t) for t in texts]
+
+
+def tokenizer_name() -> str:
+    """tiktoken が使えればその名前、使えなければ FakeEncoder に差し替えて "fake" を返す"""
+    import tokens
+    try:
+        tokens.get_encoder()
+        return tokens.ENCODING
+    except Exception:
+        import summarizer
+        fake = FakeEncoder()
+        tokens.get_encoder = summarizer.get_encoder = lambda: fake
+        return "fake"
+
+
+@contextmanager
+def installed(api: FakeTranscriptApi | None = None, ydl: FakeYoutubeDL | None = None,
+              model: FakeModel | None = None, context_cache: FakeContextCache | None = None):
+    """
+    transcript / summarizer の外部呼び出し先を代替品に差し替える（抜けると元に戻す）
+    プロキシとレート制限も外し、代替品のレイテンシだけが効くようにする
+    """
+    import transcript, summarizer
+    from ratelimit import RateLimiter
+
+    saved = {
+        "api": transcript.YouTubeTranscriptApi,
+        "extractor": transcript._get_extractor,
+        "proxy": transcript.TRANSCRIPT_USE_PROXY,
+        "limiter": summarizer.rate_limiter,
+        "factory": summarizer._backend_factories.get(summarizer.Backend.GEMINI),
+        "context": summarizer._context_factories.get(summarizer.Backend.GEMINI),
+    }
+    if api is not None:
+        transcript.YouTubeTranscriptApi = api
+    if ydl is not None:
+        transcript._get_extractor = lambda: ydl
+    transcript.TRANSCRIPT_USE_PROXY = False
+    summarizer.rate_limiter = RateLimiter(rpm=1e9, tpm=1e12)
+    if model is not None:
+        summarizer.register_backend(summarizer.Backend.GEMINI, lambda: model)
+    if context_cache is not None:
+        summarizer.register_context_cache(summarizer.Backend.GEMINI, context_cache)
+    try:
+        yield
+    finally:
+        transcript.YouTubeTranscriptApi = saved["api"]
+        transcript._get_extractor = saved["extractor"]
+        transcript.TRANSCRIPT_USE_PROXY = saved["proxy"]
+        summarizer.rate_limiter = saved["limiter"]
+        if model is not None and saved["factory"] is not None:
+            summarizer.register_backend(summarizer.Backend.GEMINI, saved["factory"])
+        if context_cache is not None and saved["context"] is not None:
+            summarizer.register_context_cache(summarizer.Backend.GEMINI, saved["context"])
@@ -0,0 +1,137 @@
+# cache.py
+"""
+SQLite ベースの永続キャッシュ
+・TTL（期限切れは読み出し時に破棄）
+・件数／バイト数上限による LRU 追い出し
+・「字幕なし」などのネガティブキャッシュ
+・ヒット／ミス等のカウンタ
+"""
+from dataclasses import dataclass
+from pathlib import Path
+import os, sqlite3, threading, time
+
+CACHE_DIR = Path(os.getenv("YT_SUMMARIZER_CACHE_DIR", "cache"))
+
+
+@dataclass
+class CacheEntry:
+    value: bytes | None
+    negative: bool = False
+
+
+class DiskCache:
+    """
+    key(str) → value(bytes) の永続キャッシュ。
+    値のシリアライズは呼び出し側で行う。
+    """
+
+    def __init__(self, path: str | Path, ttl: float = 7 * 24 * 3600,
+                 negative_ttl: float = 3600, max_entries: int = 10_000,
+                 max_bytes: int = 512 * 1024 * 1024):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Streamlit はセッションごとに別スレッドで動くので接続を共有してロックで守る
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key         TEXT PRIMARY KEY,
+                value       BLOB,
+                negative    INTEGER NOT NULL DEFAULT 0,
+                size        INTEGER NOT NULL,
+                expires_at  REAL NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_access)")
+
+    def get(self, key: str) -> CacheEntry | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, negative, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, negative, expires_at = row
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            if negative:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return CacheEntry(value, bool(negative))
+
+    def put(self, key: str, value: bytes, ttl: float | None = None):
+        self._put(key, value, False, self.ttl if ttl is None else ttl)
+
+    def put_negative(self, key: str, reason: str = "", ttl: float | None = None):
+        """「結果なし」を短めの TTL で記録する"""
+        self._put(key, reason.encode("utf-8"), True,
+                  self.negative_ttl if ttl is None else ttl)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+            "entries": count,
+            "bytes": size,
+        }
+
+    def _put(self, key: str, value: bytes, negative: bool, ttl: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (key, value, int(negative), len(value), now + ttl, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float):
+        # 期限切れを先に掃除し、残りは last_access の古い順に上限まで削る
+        cur = self._conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        self.evictions += cur.rowcount
+        count, size = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+        removed = 0
+        for key, entry_size in self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_access ASC"
+        ).fetchall():
+            if count - removed <= self.max_entries and size <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            removed += 1
+            size -= entry_size
+        self.evictions += removed
@@ -0,0 +1,137 @@
+# compaction.py
+"""
+LLM に渡す前の字幕の圧縮
+・ローリング表示の自動字幕で前後のキューに重なっている部分を取り除く
+・フィラー（えー、あのー、um など）や [音楽] などの注記、余分な空白を除く
+・細切れのセグメントを文単位にまとめる
+"""
+import logging, re
+from tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# 重なりとみなす最小の文字数（短すぎる一致は偶然の可能性が高い）
+MIN_OVERLAP_CHARS = 4
+# 英語など空白で区切る言語では単語数でも数える（"agree" のような1語の返事を重なりとみなさない）
+MIN_OVERLAP_WORDS = 2
+SENTENCE_MAX_CHARS = 200
+
+_FILLER_RE = re.compile(
+    r"(?:(?<=\s)|^)(?:え[ーっ]+と?|えっと|ええっ?と|あの[ーう]+|その[ーう]+|うー+ん|ん[ーっ]+|"
+    r"um+|uh+|erm+|uhm+)[、,]?(?=\s|$)",
+    re.IGNORECASE,
+)
+_ANNOTATION_RE = re.compile(r"[\[［(（](?:音楽|拍手|笑|笑い|Music|Applause|Laughter)[\]］)）]", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+_SENTENCE_END = ("。", "！", "？", "!", "?", ".")
+
+
+def clean_text(text: str) -> str:
+    """フィラー・注記を除き、空白を1つにまとめる"""
+    text = _ANNOTATION_RE.sub(" ", text)
+    text = _FILLER_RE.sub(" ", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def _is_latin(c: str) -> bool:
+    """空白で単語を区切る文字（英数字など。かな・漢字は含めない）"""
+    return c.isalnum() and ord(c) < 0x3000
+
+
+def _boundary(text: str, i: int) -> bool:
+    """text の i 文字目の手前が単語の切れ目か（英単語の途中で切れていないか）"""
+    return i <= 0 or i >= len(text) or not (_is_latin(text[i - 1]) and _is_latin(text[i]))
+
+
+def _long_enough(overlap: str) -> bool:
+    if len(overlap) < MIN_OVERLAP_CHARS:
+        return False
+    return not any(map(_is_latin, overlap)) or len(overlap.split()) >= MIN_OVERLAP_WORDS
+
+
+def _rolling(prev: str, overlap: str) -> bool:
+    """prev の末尾の overlap が、ローリング表示で次のキューに繰り返された部分とみなせるか"""
+    return _long_enough(overlap) and _boundary(prev, len(prev) - len(overlap))
+
+
+def _overlap(prev: str, cur: str) -> int:
+    """
+    prev の末尾と cur の先頭が一致する最長の文字数
+    単語の途中で切れる一致や、短すぎる一致（_long_enough）は重なりとみなさず 0
+    """
+    for k in range(min(len(prev), len(cur)), MIN_OVERLAP_CHARS - 1, -1):
+        if prev.endswith(cur[:k]) and _boundary(cur, k) and _rolling(prev, cur[:k]):
+            return k
+    return 0
+
+
+def merge_rolling(transcript: list[dict]) -> list[dict]:
+    """
+    前のセグメントの末尾と重なる先頭部分を削る。
+    前のセグメントの末尾そのものは、前のセグメントの長さを延ばして捨てる
+    """
+    out = []
+    for seg in transcript:
+        text = seg["text"].strip()
+        if out:
+            prev = out[-1]
+            if prev["text"].endswith(text) and _rolling(prev["text"], text):
+                prev["duration"] = max(prev["duration"], seg["start"] + seg["duration"] - prev["start"])
+                continue
+            k = _overlap(prev["text"], text)
+            text = text[k:].strip()
+            if not text:
+                continue
+        out.append({"text": text, "start": seg["start"], "duration": seg["duration"]})
+    return out
+
+
+def merge_sentences(transcript: list[dict], max_chars: int = SENTENCE_MAX_CHARS) -> list[dict]:
+    """句点などで終わるか max_chars を超えるまでセグメントをつなげる"""
+    out, buf = [], []
+    start = end = 0.0
+    for seg in transcript:
+        if not buf:
+            start = seg["start"]
+        buf.append(seg["text"])
+        end = seg["start"] + seg["duration"]
+        if seg["text"].endswith(_SENTENCE_END) or sum(len(t) for t in buf) >= max_chars:
+            out.append({"text": " ".join(buf), "start": start, "duration": end - start})
+            buf = []
+    if buf:
+        out.append({"text": " ".join(buf), "start": start, "duration": end - start})
+    return out
+
+
+def compact_transcript(transcript: list[dict], sentences: bool = True, token_stats: bool = True,
+                       tokens_before: int | None = None) -> tuple[list[dict], dict]:
+    """
+    重なりの除去 → テキストの掃除 → （必要なら）文単位への結合 を行う
+    token_stats=False なら統計にトークン数を含めない（トークナイザを通さない分速い）
+    tokens_before: 呼び出し側で数え済みの圧縮前のトークン数（渡せば数え直さない）
+    戻り値: (圧縮後の字幕, 統計)
+    """
+    merged = merge_rolling(transcript)
+    cleaned = []
+    for seg in merged:
+        text = clean_text(seg["text"])
+        if text:
+            cleaned.append({"text": text, "start": seg["start"], "duration": seg["duration"]})
+    compacted = merge_sentences(cleaned) if sentences else cleaned
+
+    stats = {
+        "segments_before": len(transcript),
+        "segments_after": len(compacted),
+    }
+    if not token_stats:
+        logger.info(f"字幕を圧縮: {stats['segments_before']}→{stats['segments_after']} セグメント")
+        return compacted, stats
+    if tokens_before is None:
+        tokens_before = count_tokens("\n".join(t["text"] for t in transcript))
+    stats["tokens_before"] = tokens_before
+    stats["tokens_after"] = count_tokens("\n".join(t["text"] for t in compacted))
+    logger.info(
+        f"字幕を圧縮: {stats['segments_before']}→{stats['segments_after']} セグメント, "
+        f"{stats['tokens_before']}→{stats['tokens_after']} トークン"
+    )
+    return compacted, stats
@@ -0,0 +1,137 @@
+# extractive.py
+"""
+LLM を使わない抽出型要約（オフライン・数十ミリ秒）
+・字幕のセグメント（圧縮済みなら文）を TF-IDF ベクトルにし、TextRank で重要度を付ける
+・日本語などの CJK は単語分割の代わりに文字 bigram、英数字は単語で数える
+・重要度の高い文を要点として、時刻付きのハイライトと合わせて出力する
+大まかな内容確認・バッチの事前ふるい分け・Gemini がレート制限中の代替に使う
+"""
+from collections import Counter
+import logging, os, re
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 要点・ハイライトの件数（0 なら字幕の長さから決める）
+EXTRACTIVE_SENTENCES = int(os.getenv("EXTRACTIVE_SENTENCES", 0))
+# TextRank の計算量は文数の2乗なので、これを超える場合は隣り合う文をまとめる
+MAX_UNITS = 1500
+MAX_FEATURES = 4096
+# 選んだ文同士のコサイン類似度がこれ以上なら重複とみなして飛ばす
+REDUNDANCY_THRESHOLD = 0.6
+DAMPING = 0.85
+
+_WORD_RE = re.compile(r"[0-9A-Za-z][0-9A-Za-z'\-]*|[぀-ヿ㐀-鿿豈-﫿가-힯]+")
+_CJK_RE = re.compile(r"[぀-ヿ㐀-鿿豈-﫿가-힯]")
+_STOPWORDS = {
+    "the", "a", "an", "and", "or", "of", "to", "in", "on", "is", "are", "was", "it", "that", "this",
+    "for", "with", "as", "be", "we", "you", "i", "so", "but", "they", "at", "by", "from",
+    "です", "ます", "して", "した", "って", "ので", "から", "けど", "ね", "よ", "の", "は", "が", "を", "に", "で", "と",
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """英数字は小文字の単語、CJK の連なりは文字 bigram（1文字だけならその文字）に分ける"""
+    out = []
+    for run in _WORD_RE.findall(text):
+        if _CJK_RE.match(run):
+            grams = [run] if len(run) == 1 else [run[i:i + 2] for i in range(len(run) - 1)]
+            out.extend(g for g in grams if g not in _STOPWORDS)
+        else:
+            word = run.lower()
+            if word not in _STOPWORDS and len(word) > 1:
+                out.append(word)
+    return out
+
+
+def _units(transcript: list[dict]) -> list[dict]:
+    """要約の単位。多すぎる場合は隣り合うセグメントをまとめて MAX_UNITS 以内にする"""
+    segs = [s for s in transcript if s["text"].strip()]
+    if len(segs) <= MAX_UNITS:
+        return [{"text": s["text"].strip(), "start": float(s["start"])} for s in segs]
+    size = -(-len(segs) // MAX_UNITS)
+    return [
+        {"text": " ".join(s["text"].strip() for s in segs[i:i + size]), "start": float(segs[i]["start"])}
+        for i in range(0, len(segs), size)
+    ]
+
+
+def tfidf_matrix(docs: list[list[str]]) -> np.ndarray:
+    """行ごとに L2 正規化した TF-IDF 行列（語彙は文書頻度の高い順に MAX_FEATURES まで）"""
+    df = Counter(t for doc in docs for t in set(doc))
+    # 1文にしか出ない語は文同士の類似度に寄与しないので、語彙が多いときは落とす
+    vocab_terms = [t for t, c in df.most_common(MAX_FEATURES) if c > 1 or len(df) <= MAX_FEATURES]
+    vocab = {t: i for i, t in enumerate(vocab_terms)}
+    x = np.zeros((len(docs), len(vocab)), dtype=np.float32)
+    for row, doc in enumerate(docs):
+        for t, c in Counter(doc).items():
+            col = vocab.get(t)
+            if col is not None:
+                x[row, col] = 1 + np.log(c)
+    if not vocab:
+        return x
+    idf = np.log((1 + len(docs)) / (1 + np.array([df[t] for t in vocab_terms], dtype=np.float32))) + 1
+    x *= idf
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.where(norms == 0, 1, norms)
+
+
+def textrank(x: np.ndarray, iterations: int = 50, tol: float = 1e-6) -> np.ndarray:
+    """コサイン類似度のグラフ上で PageRank を計算する"""
+    n = x.shape[0]
+    if n == 0:
+        return np.zeros(0, dtype=np.float32)
+    sim = x @ x.T
+    np.fill_diagonal(sim, 0)
+    degree = sim.sum(axis=1, keepdims=True)
+    # 他のどの文とも似ていない文は全体に一様に遷移させる
+    trans = np.where(degree > 0, sim / np.where(degree == 0, 1, degree), 1.0 / n)
+    scores = np.full(n, 1.0 / n, dtype=np.float32)
+    for _ in range(iterations):
+        updated = (1 - DAMPING) / n + DAMPING * (trans.T @ scores)
+        if np.abs(updated - scores).sum() < tol:
+            return updated
+        scores = updated
+    return scores
+
+
+def extract_highlights(transcript: list[dict], k: int | None = None) -> list[dict]:
+    """
+    重要度の高い文を k 件、重複を避けて選ぶ（重要度の高い順）
+    戻り値: [{"text", "start", "score"}, ...]
+    """
+    units = _units(transcript)
+    if not units:
+        return []
+    if k is None:
+        k = EXTRACTIVE_SENTENCES or min(12, max(6, len(units) // 30))
+    x = tfidf_matrix([tokenize(u["text"]) for u in units])
+    scores = textrank(x)
+    chosen = []
+    for i in np.argsort(-scores, kind="stable"):
+        if len(chosen) >= k:
+            break
+        if chosen and float(np.max(x[chosen] @ x[i])) >= REDUNDANCY_THRESHOLD:
+            continue
+        chosen.append(int(i))
+    return [{"text": units[i]["text"], "start": units[i]["start"], "score": float(scores[i])} for i in chosen]
+
+
+def format_timestamp(seconds: float) -> str:
+    h, rem = divmod(int(seconds), 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
+
+def summarize(transcript: list[dict], k: int | None = None) -> str:
+    """
+    Markdown を返す。上位半分を要点（重要度順）に、全件を時刻付きハイライト（時系列順）に出す
+    """
+    highlights = extract_highlights(transcript, k)
+    if not highlights:
+        return ""
+    lines = ["■ 要点"]
+    lines += [f"・{h['text']}" for h in highlights[:-(-len(highlights) // 2)]]
+    lines += ["", "■ ハイライト"]
+    lines += [f"〈{format_timestamp(h['start'])}〉 {h['text']}" for h in sorted(highlights, key=lambda h: h["start"])]
+    return "\n".join(lines)
@@ -0,0 +1,121 @@
+# jobs.py
+"""
+プロセス共通のジョブキュー
+・上限付きのワーカープールで実行
+・同じキーのジョブが実行中なら新たに実行せず、そのジョブを共有する（single-flight）
+・UI からのポーリング用に状態・途中経過を保持し、待ち時間などを計測する
+"""
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Hashable
+import logging, threading, time, traceback, uuid
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    id: str
+    key: Hashable
+    status: str = "queued"           # queued / running / done / error
+    stage: str = ""                  # UI 表示用の現在の処理段階
+    partial: str = ""                # ストリーミング中の途中結果
+    data: dict = field(default_factory=dict)
+    result: Any = None
+    error: str | None = None
+    error_detail: str | None = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    requesters: int = 1              # このジョブを共有しているリクエスト数
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "error")
+
+    @property
+    def wait_time(self) -> float | None:
+        return None if self.started_at is None else self.started_at - self.submitted_at
+
+
+class JobQueue:
+    def __init__(self, max_workers: int = 4, keep_finished: int = 200):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._inflight: dict[Hashable, Job] = {}
+        self._keep_finished = keep_finished
+        self._wait_times = deque(maxlen=1000)
+        self.max_workers = max_workers
+        self.submitted = 0
+        self.deduplicated = 0
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, key: Hashable, fn: Callable[[Job], Any]) -> Job:
+        """
+        fn(job) をワーカーで実行する。同じ key のジョブが未完了ならそれを返す
+        fn は job.stage / job.partial / job.data を更新して途中経過を伝えられる
+        """
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is not None:
+                job.requesters += 1
+                self.deduplicated += 1
+                return job
+            job = Job(id=uuid.uuid4().hex, key=key)
+            self._jobs[job.id] = job
+            self._inflight[key] = job
+            self.submitted += 1
+            self._trim()
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: Job, fn: Callable[[Job], Any]):
+        job.started_at = time.time()
+        job.status = "running"
+        with self._lock:
+            self._wait_times.append(job.wait_time)
+        try:
+            job.result = fn(job)
+            job.status = "done"
+        except Exception as e:
+            logger.error(f"ジョブの実行に失敗: {str(e)}")
+            job.error = str(e)
+            job.error_detail = traceback.format_exc()
+            job.status = "error"
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._inflight.pop(job.key, None)
+                if job.status == "done":
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def _trim(self):
+        # 完了済みのジョブは古いものから捨てる（未完了は残す）
+        finished = [j.id for j in self._jobs.values() if j.finished]
+        for job_id in finished[:max(0, len(finished) - self._keep_finished)]:
+            del self._jobs[job_id]
+
+    def metrics(self) -> dict:
+        with self._lock:
+            jobs = list(self._jobs.values())
+            waits = sorted(self._wait_times)
+        return {
+            "queue_depth": sum(j.status == "queued" for j in jobs),
+            "running": sum(j.status == "running" for j in jobs),
+            "workers": self.max_workers,
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "completed": self.completed,
+            "failed": self.failed,
+            "wait_avg": sum(waits) / len(waits) if waits else 0.0,
+            "wait_p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+        }
@@ -0,0 +1,113 @@
+# live.py
+"""
+ライブ配信・プレミア公開など、字幕が伸びていく動画の差分要約
+・動画ごとに「どこまで要約したか（最後のセグメントの開始時刻）」と最新の要約を保存する
+・更新時は字幕を取り直し、前回より後のセグメントだけを要約に反映する
+・1回の更新のコストは全体の長さではなく、増えた分の長さに比例する
+・最後のキューは配信中だとまだ伸びている途中のことがあるので、次の更新まで反映を待つ
+・クォータ超過で抽出型の代替要約になったときは保存しない（次の更新で同じ差分から LLM でやり直す）
+"""
+from dataclasses import asdict, dataclass
+from bisect import bisect_right
+import hashlib, json, logging, os, time
+
+from cache import DiskCache, CACHE_DIR
+from segments import Transcript
+from summarizer import Backend, DEFAULT_PROMPT, FALLBACK_NOTICE, summarize, update_summary
+from transcript import get_transcript
+import metrics
+
+# 差分要約の状態を残す期間（秒）
+LIVE_STATE_TTL = float(os.getenv("LIVE_STATE_TTL", 3 * 24 * 3600))
+
+logger = logging.getLogger(__name__)
+
+_state_cache = None
+
+
+@dataclass
+class LiveState:
+    summary: str = ""
+    last_start: float = -1.0    # 要約に反映済みの最後のセグメントの開始時刻（秒）
+    segments: int = 0           # 反映済みのセグメント数
+    updates: int = 0
+    updated_at: float = 0.0
+
+
+def state_cache() -> DiskCache:
+    global _state_cache
+    if _state_cache is None:
+        _state_cache = DiskCache(CACHE_DIR / "live.sqlite3", ttl=LIVE_STATE_TTL, max_entries=1000)
+    return _state_cache
+
+
+def _state_key(video_id: str, lang: str, backend: Backend, prompt: str) -> str:
+    normalized = " ".join(prompt.split())
+    prompt_hash = hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
+    return f"{video_id}:{lang}:{backend.value}:{prompt_hash}"
+
+
+def load_state(video_id: str, lang: str = "ja", backend: Backend = Backend.GEMINI,
+               prompt: str = None) -> LiveState:
+    entry = state_cache().get(_state_key(video_id, lang, backend, prompt or DEFAULT_PROMPT))
+    if entry is None or entry.negative:
+        return LiveState()
+    return LiveState(**json.loads(entry.value))
+
+
+def reset_state(video_id: str, lang: str = "ja", backend: Backend = Backend.GEMINI, prompt: str = None):
+    state_cache().delete(_state_key(video_id, lang, backend, prompt or DEFAULT_PROMPT))
+
+
+def new_segments(transcript: Transcript, last_start: float) -> Transcript:
+    """last_start より後に始まるセグメント（開始時刻順に並んでいる前提で二分探索）"""
+    return transcript[bisect_right(transcript.starts, last_start):]
+
+
+def refresh(video_id: str, lang: str = "ja", backend: Backend = Backend.GEMINI,
+            prompt: str = None, transcript: Transcript | list[dict] | None = None,
+            final: bool = False) -> tuple[LiveState, int]:
+    """
+    字幕を取り直して、前回の更新以降のセグメントだけを要約に反映する
+    transcript を渡した場合は取り直さずにそれを使う（呼び出し側で取得済みのとき）
+    最後のセグメントは次の更新まで反映しない。final=True（配信が終わって字幕が確定した）なら含める
+    戻り値: (更新後の状態, 今回反映したセグメント数)
+    """
+    prompt = prompt or DEFAULT_PROMPT
+    key = _state_key(video_id, lang, backend, prompt)
+    state = load_state(video_id, lang, backend, prompt)
+
+    with metrics.trace("live", video_id=video_id):
+        # 伸びていく字幕なのでキャッシュは使わずに毎回取り直す
+        if transcript is None:
+            with metrics.span("get_transcript"):
+                transcript = get_transcript(video_id, lang, use_cache=False)
+        transcript = Transcript.from_segments(transcript)
+        settled = transcript if final else transcript[:-1]
+        delta = new_segments(settled, state.last_start)
+        metrics.annotate(new_segments=len(delta), total_segments=len(transcript))
+        if not len(delta):
+            logger.info(f"新しい字幕はありません: {video_id}")
+            return state, 0
+
+        if backend == Backend.EXTRACTIVE:
+            # 抽出型は全体をやり直しても一瞬で終わる
+            summary = summarize(settled, backend=backend)
+        else:
+            summary = update_summary(state.summary, delta.to_list(), backend=backend, prompt=prompt)
+
+    if summary.startswith(FALLBACK_NOTICE):
+        # 代替要約は今回の表示にだけ使い、状態は前回のまま残す
+        logger.warning(f"代替要約のため差分要約の状態は更新しません: {video_id}")
+        return LiveState(**{**asdict(state), "summary": summary}), len(delta)
+
+    state = LiveState(
+        summary=summary,
+        last_start=delta.starts[-1],
+        segments=state.segments + len(delta),
+        updates=state.updates + 1,
+        updated_at=time.time(),
+    )
+    state_cache().put(key, json.dumps(asdict(state), ensure_ascii=False).encode("utf-8"))
+    logger.info(f"差分要約を更新: {video_id} +{len(delta)} セグメント（累計 {state.segments}）")
+    return state, len(delta)
@@ -1,22 +1,170 @@
 import json, subprocess, pathlib, argparse, sys
-from utils.youtube import parse_url
+from utils.youtube import parse_url, classify_url, expand_url, VIDEO
 from transcript import get_transcript
 from summarizer import summarize, Backend
-import tempfile, os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+import metrics
+import tempfile, os, queue, threading, time
 from pathlib import Path
 
-def run(url: str, method: str, backend: Backend = Backend.GEMINI):
-    vid = parse_url(url)
+def run(url: str, method: str, backend: Backend = Backend.GEMINI, use_cache: bool = True):
+    with metrics.trace("run", url=url):
+        with metrics.span("parse_url"):
+            vid = parse_url(url)
+        metrics.annotate(video_id=vid)
+        try:
+            with metrics.span("get_transcript"):
+                tr = get_transcript(vid, use_cache=use_cache)
+            print("✓ caption API")
+            return tr  # 字幕データを返す
+        except Exception as e:
+            raise Exception(str(e))  # エラーメッセージをそのまま伝播
+
+def read_urls(source: str) -> list[str]:
+    """URL 一覧をファイル（"-" なら標準入力）から読む。空行と # コメントは無視"""
+    f = sys.stdin if source == "-" else open(source, encoding="utf-8")
     try:
-        tr = get_transcript(vid)
-        print("✓ caption API")
-        return tr  # 字幕データを返す
-    except Exception as e:
-        raise Exception(str(e))  # エラーメッセージをそのまま伝播
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def _load_done(out_path: str) -> set[str]:
+    """
+    既存の出力 JSONL から処理済み（status=ok）の URL を集める
+    途中で書き込みが切れた最終行は取り除いてから追記できるようにする
+    """
+    path = Path(out_path)
+    if not path.exists():
+        return set()
+    data = path.read_bytes()
+    if data and not data.endswith(b"\n"):
+        data = data[:data.rfind(b"\n") + 1]
+        path.write_bytes(data)
+    done = set()
+    for line in data.decode("utf-8").splitlines():
+        try:
+            rec = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if rec.get("status") == "ok":
+            done.add(rec["url"])
+    return done
+
+def expand_urls(urls: list[str], limit: int | None = None) -> list[dict]:
+    """
+    再生リスト・チャンネルの URL を動画に展開し、重複を除いて入力順に並べる
+    戻り値: [{"video_id", "url", "title"}, ...]。展開に失敗した URL は "error" 付きで返す
+    """
+    videos, seen = [], set()
+    for url in urls:
+        try:
+            entries = expand_url(url, limit) if classify_url(url)[0] != VIDEO else [
+                {"video_id": parse_url(url), "url": url, "title": None}]
+        except Exception as e:
+            videos.append({"video_id": None, "url": url, "title": None, "error": str(e)})
+            continue
+        for entry in entries:
+            if entry["video_id"] not in seen:
+                seen.add(entry["video_id"])
+                videos.append(entry)
+    return videos
+
+def run_batch(urls: list[str], out, backend: Backend = Backend.GEMINI, prompt: str = None,
+              fetch_workers: int = 8, summarize_workers: int = 4, use_cache: bool = True,
+              progress: Callable[[str, str, dict | None], None] | None = None,
+              errors: list[dict] | None = None) -> tuple[int, int]:
+    """
+    複数 URL を「字幕取得」「要約」の2段で並列処理し、完了順に JSONL で書き出す
+    各段の並列数は独立に指定でき、段の間に溜まる字幕は一定数に抑える
+    （字幕の取得は要約より先行して進み、要約待ちの字幕が溜まると取得を止める）
+    progress(url, 段階, 結果) は "fetching" / "summarizing" / "ok" / "error" ごとに
+    ワーカースレッドから呼ばれる（結果は ok / error のときだけ）
+    errors: 処理の前に失敗が決まっている URL の結果（再生リストの展開の失敗など）。最初に同じ形式で書き出す
+    戻り値: (成功数, 失敗数)
+    """
+    notify = progress or (lambda url, stage, rec: None)
+    results = queue.Queue()
+    # 取得済みで要約待ちの字幕が溜まりすぎないよう、同時に抱える件数を制限
+    in_flight = threading.BoundedSemaphore(fetch_workers + summarize_workers * 2)
+
+    def fetch(url: str):
+        started = time.perf_counter()
+        notify(url, "fetching", None)
+        try:
+            with metrics.trace("batch_fetch", url=url):
+                with metrics.span("parse_url"):
+                    vid = parse_url(url)
+                metrics.annotate(video_id=vid)
+                with metrics.span("get_transcript"):
+                    tr = get_transcript(vid, use_cache=use_cache)
+        except Exception as e:
+            results.put({"url": url, "status": "error", "stage": "fetch", "error": str(e)})
+            return
+        summarize_pool.submit(summarize_one, url, vid, tr, started)
+
+    def summarize_one(url: str, vid: str, tr: list[dict], started: float):
+        notify(url, "summarizing", None)
+        try:
+            with metrics.trace("batch_summarize", url=url, video_id=vid):
+                summary = summarize(tr, backend=backend, prompt=prompt, use_cache=use_cache)
+        except Exception as e:
+            results.put({"url": url, "video_id": vid, "status": "error", "stage": "summarize", "error": str(e)})
+            return
+        results.put({
+            "url": url,
+            "video_id": vid,
+            "status": "ok",
+            "segments": len(tr),
+            "summary": summary,
+            "elapsed": round(time.perf_counter() - started, 3),
+        })
+
+    def write(rec: dict):
+        out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        out.flush()
+        counts[rec["status"]] += 1
+        notify(rec["url"], rec["status"], rec)
+
+    def write_results():
+        try:
+            for _ in range(len(urls)):
+                write(results.get())
+                in_flight.release()
+        except BaseException as e:
+            # 書き出せなくなったら（出力先の I/O エラーなど）投入側を止めて呼び出し元に伝える
+            writer_error.append(e)
+            stopped.set()
+
+    counts = {"ok": 0, "error": 0}
+    writer_error = []
+    stopped = threading.Event()
+    for rec in errors or []:
+        write(rec)
+    writer = threading.Thread(target=write_results, daemon=True)
+    writer.start()
+    with ThreadPoolExecutor(max_workers=summarize_workers) as summarize_pool, \
+         ThreadPoolExecutor(max_workers=fetch_workers) as fetch_pool:
+        for url in urls:
+            # 枠が空くのを待つ間も書き出しの停止を確認する（止まったら枠は二度と空かない）
+            while not in_flight.acquire(timeout=0.5):
+                if stopped.is_set():
+                    break
+            if stopped.is_set():
+                break
+            fetch_pool.submit(fetch, url)
+        writer.join()
+        if writer_error:
+            fetch_pool.shutdown(wait=False, cancel_futures=True)
+            summarize_pool.shutdown(wait=False, cancel_futures=True)
+    if writer_error:
+        raise Exception(f"結果の書き出しに失敗しました: {str(writer_error[0])}") from writer_error[0]
+    return counts["ok"], counts["error"]
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("url", help="YouTube URL")
+    parser.add_argument("url", nargs="?", help="YouTube URL（再生リスト・チャンネルの URL なら全動画をバッチ処理）")
     parser.add_argument(
         "--method",
         choices=["auto", "caption"],
@@ -25,9 +173,113 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "--backend",
-        choices=["gemini"],
+        choices=[b.value for b in Backend],
         default="gemini",
-        help="LLM backend for summarization",
+        help="summarization backend (extractive = LLM を使わないオフラインの抽出型要約)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="字幕・要約キャッシュを使わない",
     )
+    parser.add_argument("--batch", metavar="FILE", help="URL 一覧ファイル（- で標準入力）。再生リスト・チャンネルも可")
+    parser.add_argument("--limit", type=int, default=None, help="再生リスト・チャンネルから取り出す動画数の上限")
+    parser.add_argument("--out", default="-", help="バッチ結果の JSONL 出力先（既存ファイルは続きから再開）")
+    parser.add_argument("--fetch-workers", type=int, default=8, help="字幕取得の並列数")
+    parser.add_argument("--summarize-workers", type=int, default=4, help="要約の並列数")
+    parser.add_argument("--live", action="store_true",
+                        help="ライブ配信などの差分要約（前回以降に増えた字幕だけを要約に反映する）")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="--live で更新を繰り返す間隔（秒）。0 なら1回だけ")
+    parser.add_argument("--stream", action="store_true",
+                        help="字幕を受信しながら要約を始める（長時間の動画向け。メモリ使用量が動画の長さによらない）")
+    parser.add_argument("--metrics-file", default=metrics.METRICS_PROM_FILE,
+                        help="終了時に Prometheus 形式のメトリクスを書き出すファイル")
+    parser.add_argument("--trace-log", action="store_true", default=metrics.METRICS_TRACE_LOG,
+                        help="処理ごとの計測（段ごとの所要時間・属性）を JSON で標準エラーに出す")
     args = parser.parse_args()
-    run(args.url, args.method, Backend(args.backend))
+    use_cache = not args.no_cache
+    if args.trace_log:
+        metrics.enable_trace_log()
+    if args.metrics_file:
+        import atexit
+        atexit.register(metrics.write_prometheus, args.metrics_file)
+
+    if not args.batch and args.url and not args.live and classify_url(args.url)[0] != VIDEO:
+        # 再生リスト・チャンネルはバッチとして処理する
+        args.batch = [args.url]
+
+    if args.batch and args.method != "auto":
+        # バッチは常に字幕の取得方法を自動で選ぶ（取得元の並走）
+        parser.error("--method はバッチ（--batch・再生リスト・チャンネル）では指定できません")
+
+    if args.batch:
+        sources = args.batch if isinstance(args.batch, list) else read_urls(args.batch)
+        videos = expand_urls(sources, args.limit)
+        # 展開に失敗した URL も他の失敗と同じく JSONL に error として残す
+        expand_errors = [{"url": v["url"], "status": "error", "stage": "expand", "error": v["error"]}
+                         for v in videos if "error" in v]
+        titles = {v["url"]: v["title"] for v in videos if "error" not in v}
+        urls = list(titles)
+        total = len(urls) + len(expand_errors)
+        finished = [0]
+
+        def report(url: str, stage: str, rec: dict | None):
+            # 動画ごとの進捗を標準エラーに出す（JSONL の出力先とは分ける）
+            if stage not in ("ok", "error"):
+                return
+            finished[0] += 1
+            mark = "✓" if stage == "ok" else f"✗ {rec.get('stage')}: {rec.get('error')}"
+            print(f"[{finished[0]}/{total}] {titles.get(url) or url} {mark}", file=sys.stderr, flush=True)
+
+        if args.out == "-":
+            out = sys.stdout
+        else:
+            done = _load_done(args.out)
+            urls = [u for u in urls if u not in done]
+            total = len(urls) + len(expand_errors)
+            out = open(args.out, "a", encoding="utf-8")
+        try:
+            ok, failed = run_batch(urls, out, Backend(args.backend),
+                                   fetch_workers=args.fetch_workers,
+                                   summarize_workers=args.summarize_workers,
+                                   use_cache=use_cache, progress=report, errors=expand_errors)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        print(f"✓ batch: {ok} ok / {failed} failed", file=sys.stderr)
+        sys.exit(0)
+
+    if not args.url:
+        parser.error("url か --batch のどちらかを指定してください")
+
+    if args.live:
+        import live
+        vid = parse_url(args.url)
+        try:
+            while True:
+                state, added = live.refresh(vid, backend=Backend(args.backend))
+                if added:
+                    print(f"--- 更新 {state.updates}（+{added} セグメント / 累計 {state.segments}）---")
+                    print(state.summary, flush=True)
+                if args.interval <= 0:
+                    break
+                time.sleep(args.interval)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+    if args.stream:
+        import pipeline
+        from extractive import format_timestamp
+
+        def report_partial(i, chunk, partial):
+            print(f"✓ 部分要約 {i + 1}（{format_timestamp(chunk.start)}-{format_timestamp(chunk.end)}）",
+                  file=sys.stderr, flush=True)
+
+        with metrics.trace("cli", url=args.url):
+            print(pipeline.summarize_streaming(parse_url(args.url), backend=Backend(args.backend),
+                                               use_cache=use_cache, on_partial=report_partial))
+        sys.exit(0)
+    with metrics.trace("cli", url=args.url):
+        tr = run(args.url, args.method, Backend(args.backend), use_cache=use_cache)
+        print(summarize(tr, backend=Backend(args.backend), use_cache=use_cache))
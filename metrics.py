@@ -0,0 +1,241 @@
+# metrics.py
+"""
+パイプラインの計測
+・trace(): 1リクエスト分の計測範囲。終了時に各段の所要時間と属性を JSON で1行ログ出力
+・span(): 段ごとの所要時間（parse_url / caption_api / ytdlp / parse_vtt / chunk / llm ...）
+・annotate() / inc() / observe(): 属性・カウンタ・ヒストグラム
+・render_prometheus(): Prometheus のテキスト形式で出力（ファイル or HTTP エンドポイント）
+"""
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Iterable
+import contextvars, json, logging, os, sys, threading, time, uuid
+
+# 設定
+# METRICS_PROM_FILE: trace 終了ごとに Prometheus 形式で書き出すファイル
+# METRICS_PORT: /metrics を返す HTTP サーバのポート（start_http_server で起動）
+# METRICS_TRACE_LOG: 1 なら trace ごとの JSON ログを標準エラーに出す（CLI の --trace-log の既定値）
+METRICS_PROM_FILE = os.getenv("METRICS_PROM_FILE")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_TRACE_LOG = os.getenv("METRICS_TRACE_LOG", "0") != "0"
+
+# 所要時間ヒストグラムのバケット（秒）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+logger = logging.getLogger("yt_summarizer.metrics")
+
+_current = contextvars.ContextVar("yt_summarizer_trace", default=None)
+_lock = threading.Lock()
+_counters: dict[tuple, float] = {}
+_histograms: dict[tuple, list] = {}     # key → [bucket counts..., sum, count]
+_collectors: list[Callable[[], Iterable[tuple]]] = []
+
+
+class Trace:
+    def __init__(self, name: str, **attrs):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.attrs = dict(attrs)
+        self.spans = []
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, duration: float, **attrs):
+        with self._lock:
+            self.spans.append({"name": name, "ms": round(duration * 1000, 1), **attrs})
+
+    def annotate(self, **attrs):
+        with self._lock:
+            self.attrs.update(attrs)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "trace": self.name,
+                "id": self.id,
+                "ms": round((time.perf_counter() - self.started) * 1000, 1),
+                **self.attrs,
+                "spans": list(self.spans),
+            }
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted(labels.items())))
+
+
+def inc(name: str, value: float = 1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, value: float, **labels):
+    key = _key(name, labels)
+    with _lock:
+        h = _histograms.setdefault(key, [0] * (len(BUCKETS) + 2))
+        for i, le in enumerate(BUCKETS):
+            if value <= le:
+                h[i] += 1
+        h[-2] += value
+        h[-1] += 1
+
+
+def annotate(**attrs):
+    """実行中の trace に属性（取得元・セグメント数・トークン数など）を付ける"""
+    t = _current.get()
+    if t is not None:
+        t.annotate(**attrs)
+
+
+def accumulate(**values):
+    """実行中の trace の数値属性に加算する（トークン数など複数回に分かれるもの）"""
+    t = _current.get()
+    if t is not None:
+        with t._lock:
+            for k, v in values.items():
+                t.attrs[k] = t.attrs.get(k, 0) + v
+
+
+def current_trace() -> Trace | None:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """段の所要時間を計測し、ヒストグラムと実行中の trace に記録する"""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        observe("yt_summarizer_stage_duration_seconds", duration, stage=name)
+        if status == "error":
+            inc("yt_summarizer_stage_errors_total", stage=name)
+        t = _current.get()
+        if t is not None:
+            t.add_span(name, duration, status=status, **attrs)
+
+
+@contextmanager
+def trace(name: str, **attrs):
+    """
+    1リクエスト分の計測範囲。入れ子にした場合は外側の trace に合流する
+    終了時に JSON ログを出し、METRICS_PROM_FILE があれば書き出す
+    """
+    if _current.get() is not None:
+        yield _current.get()
+        return
+    t = Trace(name, **attrs)
+    token = _current.set(t)
+    status = "ok"
+    try:
+        yield t
+    except BaseException as e:
+        status = "error"
+        t.annotate(error=str(e))
+        raise
+    finally:
+        _current.reset(token)
+        t.annotate(status=status)
+        inc("yt_summarizer_requests_total", trace=name, status=status)
+        observe("yt_summarizer_request_duration_seconds", time.perf_counter() - t.started, trace=name)
+        logger.info(json.dumps(t.to_dict(), ensure_ascii=False))
+        if METRICS_PROM_FILE:
+            write_prometheus(METRICS_PROM_FILE)
+
+
+def enable_trace_log(stream=None) -> logging.Handler:
+    """
+    trace ごとの JSON ログ（1行1件）を stream（既定: 標準エラー）に書き出す
+    ロギングを設定しない CLI でも出るよう、このロガーにだけ直接ハンドラを付ける
+    """
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return handler
+
+
+def register_collector(fn: Callable[[], Iterable[tuple]]):
+    """
+    描画時に呼ばれる値の提供元を登録する（キャッシュ・キューなど既存の統計の取り込み用）
+    fn は (名前, ラベル dict, 値) のタプルを返す
+    """
+    _collectors.append(fn)
+
+
+def _fmt_labels(labels) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{str(v)}"' for k, v in labels)
+    return "{" + inner + "}"
+
+
+def render_prometheus() -> str:
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+    lines = []
+    for name in sorted({k[0] for k in counters}):
+        lines.append(f"# TYPE {name} counter")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{name}{_fmt_labels(labels)} {value}")
+    for name in sorted({k[0] for k in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (n, labels), h in sorted(histograms.items()):
+            if n != name:
+                continue
+            for le, count in zip(BUCKETS, h):
+                lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', le),))} {count}")
+            lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', '+Inf'),))} {h[-1]}")
+            lines.append(f"{name}_sum{_fmt_labels(labels)} {h[-2]}")
+            lines.append(f"{name}_count{_fmt_labels(labels)} {h[-1]}")
+    gauges = {}
+    for fn in _collectors:
+        try:
+            for name, labels, value in fn():
+                gauges.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+        except Exception as e:
+            logger.warning(f"メトリクスの収集に失敗: {str(e)}")
+    for name, rows in sorted(gauges.items()):
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in rows:
+            lines.append(f"{name}{_fmt_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str | Path):
+    """node_exporter の textfile collector 向けに、書き換え途中が読まれないよう置き換えで書く"""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    tmp.write_text(render_prometheus(), encoding="utf-8")
+    tmp.replace(path)
+
+
+def start_http_server(port: int = METRICS_PORT, addr: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """/metrics を返す HTTP サーバをバックグラウンドで起動する"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
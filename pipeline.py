@@ -0,0 +1,207 @@
+# pipeline.py
+"""
+字幕の受信から要約までを段階ごとに待たずに流すパイプライン（長時間の動画向け）
+・yt-dlp の字幕（VTT）を受信しながら1キューずつパースする（transcript.iter_vtt）
+・セグメントは summarizer.iter_chunks でためて、CHUNK_TOKENS に達したらチャンクとして切り出す
+・切り出したチャンクはすぐに map 要約に回す（後ろの字幕はまだ受信・パース中）
+・手元に持つのは作りかけのチャンク1つ、要約中のチャンク（MAP_CONCURRENCY 個まで）と部分要約だけなので、
+  メモリは動画の長さによらずほぼ一定（部分要約はチャンクの数十分の一の大きさ）
+・受信はパースと切り離して一時ファイルに読み進める（要約待ちで接続が遊んで切られないように）
+字幕全体を持たないので、字幕・要約のキャッシュには書き込まない（キャッシュ済みの字幕があればそれを流す）
+"""
+from typing import Callable, Iterator
+import io, logging, os, tempfile, threading, time
+
+from compaction import compact_transcript
+from segments import Transcript
+from summarizer import (Backend, Chunk, CHUNK_TOKENS, COMPACT_TRANSCRIPT, MAP_CONCURRENCY,
+                        iter_chunks, summarize, summarize_chunks)
+import metrics
+import transcript
+
+# 同じテキストの重複を比べる直近のセグメント数（ローリング字幕の重複はほぼ隣り合うキューで起きる）
+PIPELINE_DEDUPE_WINDOW = int(os.getenv("PIPELINE_DEDUPE_WINDOW", 256))
+# 受信した VTT をメモリに置く上限（超えた分は一時ファイルに書く）
+PIPELINE_SPOOL_MEMORY_BYTES = int(os.getenv("PIPELINE_SPOOL_MEMORY_BYTES", 1024 * 1024))
+
+logger = logging.getLogger(__name__)
+
+
+class ReadAhead(io.RawIOBase):
+    """
+    レスポンスを別スレッドで最後まで読み進めて一時ファイルにためる読み出し専用ストリーム
+    パースが要約待ちで止まっていても受信は止まらないので、接続が長時間遊ぶことがない
+    メモリに置くのは spool_bytes までで、それを超えた分はディスクに書く
+    """
+
+    def __init__(self, res, spool_bytes: int = PIPELINE_SPOOL_MEMORY_BYTES, block: int = 64 * 1024):
+        self._res = res
+        self._spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+        self._cond = threading.Condition()
+        self._written = 0
+        self._pos = 0
+        self._done = False
+        self._error = None
+        self._thread = threading.Thread(target=self._download, args=(block,), name="vtt-read-ahead", daemon=True)
+        self._thread.start()
+
+    def _download(self, block: int):
+        try:
+            while True:
+                data = self._res.read(block)
+                if not data:
+                    break
+                with self._cond:
+                    self._spool.seek(self._written)
+                    self._spool.write(data)
+                    self._written += len(data)
+                    self._cond.notify_all()
+        except BaseException as e:
+            with self._cond:
+                self._error = e
+        finally:
+            try:
+                self._res.close()
+            except Exception:
+                pass
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        with self._cond:
+            while self._pos >= self._written and not self._done:
+                self._cond.wait()
+            if self._pos >= self._written:
+                if self._error is not None:
+                    raise self._error
+                return 0
+            self._spool.seek(self._pos)
+            data = self._spool.read(min(len(b), self._written - self._pos))
+        b[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def getvalue(self) -> bytes:
+        """受信し終えるのを待って全体を返す"""
+        self._thread.join()
+        with self._cond:
+            if self._error is not None:
+                raise self._error
+            self._spool.seek(0)
+            return self._spool.read()
+
+    def release(self):
+        """一時ファイルを消す（ストリームとして閉じた後も getvalue できるよう close とは分ける）"""
+        self.close()
+        self._thread.join()
+        self._spool.close()
+
+
+class SegmentSource:
+    """
+    字幕のセグメントを届いた順に返す（for で回す）
+    キャッシュにあればそれを、なければ yt-dlp の VTT を受信しながらパースして返す
+    VTT のトラックがないか、yt-dlp でメタデータの取得・トラックを開くのに失敗したら（ボット判定など）
+    通常の取得（Transcript API と yt-dlp の並走）で全体を取ってから返す
+    transcript() で全体も取り出せる（クォータ超過時の代替要約用）
+    """
+
+    def __init__(self, video_id: str, lang: str = "ja", use_cache: bool = True):
+        self.video_id = video_id
+        self.lang = lang
+        self.use_cache = use_cache
+        self._transcript = None     # キャッシュ・通常の取得で全体を受け取ったとき
+        self._vtt = None            # VTT を受信しながら読むとき
+
+    def __iter__(self) -> Iterator:
+        if self.use_cache:
+            entry = transcript.transcript_cache().get(f"{self.video_id}:{self.lang}")
+            if entry is not None:
+                metrics.annotate(transcript_cache="negative" if entry.negative else "hit")
+                if entry.negative:
+                    raise transcript.NoCaptionsError(transcript.NO_CAPTIONS_MESSAGE)
+                self._transcript = transcript._load_cached(entry.value)
+                yield from self._transcript
+                return
+
+        try:
+            ydl = transcript._get_extractor()
+            with metrics.span("ytdlp_extract_info"):
+                info = ydl.extract_info(f"https://www.youtube.com/watch?v={self.video_id}", download=False, process=False)
+            track = transcript._pick_subtitle_track(info, list(dict.fromkeys([self.lang, *transcript.SUBTITLE_LANGS])))
+            if track is None:
+                logger.warning("字幕ファイルが見つからないため通常の方法で取得します")
+            else:
+                kind, track_lang, url = track
+                self._vtt = ReadAhead(transcript.ResponseReader(ydl.urlopen(url)))
+                logger.info(f"字幕トラックを受信しながら要約します: {kind} {track_lang}")
+        except Exception as e:
+            logger.warning(f"yt-dlp で字幕トラックを開けないため通常の方法で取得します: {str(e)}")
+        if self._vtt is None:
+            self._transcript = transcript.get_transcript(self.video_id, self.lang, use_cache=self.use_cache)
+            yield from self._transcript
+            return
+        yield from transcript.iter_vtt(io.TextIOWrapper(io.BufferedReader(self._vtt), encoding="utf-8"),
+                                       dedupe_window=PIPELINE_DEDUPE_WINDOW)
+
+    def transcript(self) -> Transcript:
+        """字幕全体。VTT なら受信し終えるのを待ってから読み直す"""
+        if self._transcript is None:
+            if self._vtt is not None:
+                self._transcript = Transcript.from_segments(
+                    transcript.iter_vtt(io.StringIO(self._vtt.getvalue().decode("utf-8"))))
+            else:
+                self._transcript = Transcript.from_segments(iter(self))
+        return self._transcript
+
+    def close(self):
+        if self._vtt is not None:
+            self._vtt.release()
+
+
+def summarize_streaming(video_id: str, lang: str = "ja", backend: Backend = Backend.GEMINI,
+                        prompt: str = None, use_cache: bool = True,
+                        chunk_tokens: int = CHUNK_TOKENS, concurrency: int = MAP_CONCURRENCY,
+                        compact: bool = COMPACT_TRANSCRIPT,
+                        on_partial: Callable[[int, Chunk, str], None] | None = None) -> str:
+    """
+    字幕の受信・パース・チャンク分割・要約を並行して進める
+    on_partial(番号, チャンク, 部分要約) は部分要約ができるたびに（ワーカースレッドから）呼ばれる
+    クォータ超過で失敗したら summarize() と同じく字幕全体から抽出型の代替要約を作る
+    """
+    source = SegmentSource(video_id, lang, use_cache)
+    try:
+        if backend == Backend.EXTRACTIVE:
+            # 抽出型は全体を見て選ぶので、受信し終えてからまとめて処理する
+            return summarize(source.transcript(), backend=backend, compact=compact)
+
+        started = time.perf_counter()
+        lock = threading.Lock()
+        first_partial = []
+
+        def partial_done(i: int, chunk: Chunk, partial: str):
+            with lock:
+                first = not first_partial
+                first_partial.append(i)
+            if first:
+                elapsed = time.perf_counter() - started
+                metrics.annotate(time_to_first_partial=round(elapsed, 3))
+                metrics.observe("yt_summarizer_time_to_first_partial_seconds", elapsed)
+                logger.info(f"最初の部分要約まで {elapsed:.2f} 秒")
+            if on_partial is not None:
+                on_partial(i, chunk, partial)
+
+        def fallback() -> list:
+            tr = source.transcript()
+            return compact_transcript(tr, token_stats=False)[0] if compact else tr
+
+        with metrics.span("pipeline", video_id=video_id):
+            return summarize_chunks(iter_chunks(source, chunk_tokens, compact), backend, prompt,
+                                    chunk_tokens=chunk_tokens, concurrency=concurrency,
+                                    on_partial=partial_done, fallback=fallback)
+    finally:
+        source.close()
@@ -0,0 +1,133 @@
+# ratelimit.py
+"""
+LLM 呼び出し用のレート制限
+・requests/分 と tokens/分 の2つのトークンバケットで流量を抑える
+・クォータ超過（429 / ResourceExhausted）にはジッター付き指数バックオフで再試行
+・呼び出しごとの締め切り（deadline）と、待ち時間の計測
+"""
+from collections import deque
+import logging, random, threading, time
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(TimeoutError):
+    """締め切りまでに呼び出せなかった（または完了しなかった）"""
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """amount を取り出せるようになるまでの秒数（容量を超える要求は満杯になれば通す）"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._lock = threading.Lock()
+        self._queue_times = deque(maxlen=1000)
+        self.waiting = 0
+        self.calls = 0
+        self.throttled = 0
+        self.retries = 0
+
+    def acquire(self, tokens: int, deadline: float | None = None) -> float:
+        """
+        1リクエスト分と tokens 分の枠を確保するまで待つ。戻り値は待った秒数
+        deadline（time.monotonic() 基準）までに確保できなければ DeadlineExceeded
+        """
+        started = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+                    if wait <= 0:
+                        self.requests.take(1)
+                        self.tokens.take(tokens)
+                        queued = now - started
+                        self._queue_times.append(queued)
+                        self.calls += 1
+                        if queued > 0.001:
+                            self.throttled += 1
+                        return queued
+                if deadline is not None and now + wait > deadline:
+                    raise DeadlineExceeded("レート制限の待ち時間が締め切りを超えます")
+                time.sleep(min(wait, 1.0))
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            times = sorted(self._queue_times)
+            return {
+                "waiting": self.waiting,
+                "calls": self.calls,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "queue_avg": sum(times) / len(times) if times else 0.0,
+                "queue_p95": times[int(len(times) * 0.95)] if times else 0.0,
+                "queue_max": times[-1] if times else 0.0,
+            }
+
+
+def is_quota_error(e: Exception) -> bool:
+    name = type(e).__name__
+    if name in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    message = str(e).lower()
+    return "429" in message or "quota" in message or "rate limit" in message
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """フルジッター付きの指数バックオフ"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def call_with_backoff(fn, limiter: RateLimiter, tokens: int, deadline: float | None = None,
+                      max_retries: int = 5):
+    """
+    レート制限の枠を確保してから fn(remaining) を呼ぶ。remaining は締め切りまでの秒数（無ければ None）
+    クォータ超過なら締め切りと max_retries の範囲でバックオフして再試行する
+    再試行できるのは fn の中で起きた例外だけ（fn が返したストリームを読む途中の例外は対象外）
+    """
+    for attempt in range(max_retries + 1):
+        limiter.acquire(tokens, deadline)
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            # 枠の確保で締め切りを使い切った。0 以下のタイムアウトで呼ぶと即座に失敗するか無制限になる
+            raise DeadlineExceeded("レート制限の待ちで締め切りを過ぎました")
+        try:
+            return fn(remaining)
+        except Exception as e:
+            if not is_quota_error(e) or attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise DeadlineExceeded(f"クォータ超過のまま締め切りを迎えました: {str(e)}") from e
+            limiter.record_retry()
+            logger.warning(f"クォータ超過のため {delay:.1f} 秒後に再試行します ({attempt + 1}/{max_retries})")
+            time.sleep(delay)
@@ -0,0 +1,171 @@
+# retrieval.py
+"""
+「動画に質問する」ための字幕の検索インデックス（BM25）
+・字幕を RETRIEVAL_WINDOW_SECONDS ごとの区間にまとめ、区間単位で検索する
+・語の分割は extractive.tokenize（CJK は文字 bigram）
+・転置リストは NumPy の配列で持ち、字幕キャッシュと同じ DB に字幕の内容ハッシュをキーに保存する
+"""
+from collections import Counter
+import hashlib, io, json, logging, os
+import numpy as np
+
+from extractive import tokenize, format_timestamp
+from segments import Transcript
+import metrics
+
+# 検索の単位にする区間の長さ（秒）と、1区間の最大文字数
+RETRIEVAL_WINDOW_SECONDS = float(os.getenv("RETRIEVAL_WINDOW_SECONDS", 45))
+RETRIEVAL_WINDOW_MAX_CHARS = 600
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 形式を変えたら上げる（古いインデックスを読まないように）
+INDEX_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+def windows(transcript) -> Transcript:
+    """セグメントを時間（と文字数）で区切った区間にまとめる"""
+    out, buf = [], []
+    start = end = 0.0
+    for seg in transcript:
+        if buf and (seg["start"] - start >= RETRIEVAL_WINDOW_SECONDS
+                    or sum(len(t) for t in buf) >= RETRIEVAL_WINDOW_MAX_CHARS):
+            out.append({"text": " ".join(buf), "start": start, "duration": end - start})
+            buf = []
+        if not buf:
+            start = seg["start"]
+        buf.append(seg["text"])
+        end = seg["start"] + seg["duration"]
+    if buf:
+        out.append({"text": " ".join(buf), "start": start, "duration": end - start})
+    return Transcript.from_segments(out)
+
+
+class BM25Index:
+    """
+    区間（chunks）に対する BM25 の転置インデックス
+    語 t の転置リストは docs[ptr[i]:ptr[i+1]], tfs[ptr[i]:ptr[i+1]]（i = vocab[t]）
+    """
+
+    def __init__(self, chunks: Transcript, vocab: dict[str, int], ptr: np.ndarray,
+                 docs: np.ndarray, tfs: np.ndarray, doc_len: np.ndarray):
+        self.chunks = chunks
+        self.vocab = vocab
+        self.ptr = ptr
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_len = doc_len
+        n = len(doc_len)
+        df = np.diff(ptr).astype(np.float32)
+        self.idf = np.log(1 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        self.avg_len = float(doc_len.mean()) if n else 0.0
+
+    @classmethod
+    def build(cls, transcript) -> "BM25Index":
+        chunks = windows(transcript)
+        postings: dict[str, list[tuple[int, int]]] = {}
+        doc_len = np.zeros(len(chunks), dtype=np.float32)
+        for d, text in enumerate(chunks.texts()):
+            terms = Counter(tokenize(text))
+            doc_len[d] = sum(terms.values())
+            for t, c in terms.items():
+                postings.setdefault(t, []).append((d, c))
+        vocab = {t: i for i, t in enumerate(postings)}
+        ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        ptr[1:] = np.cumsum([len(p) for p in postings.values()])
+        flat = [pair for p in postings.values() for pair in p]
+        docs = np.array([d for d, _ in flat], dtype=np.int32)
+        tfs = np.array([c for _, c in flat], dtype=np.float32)
+        return cls(chunks, vocab, ptr, docs, tfs, doc_len)
+
+    def scores(self, query: str) -> np.ndarray:
+        out = np.zeros(len(self.doc_len), dtype=np.float32)
+        if not len(out):
+            return out
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len / max(self.avg_len, 1e-6))
+        for t, qtf in Counter(tokenize(query)).items():
+            i = self.vocab.get(t)
+            if i is None:
+                continue
+            docs = self.docs[self.ptr[i]:self.ptr[i + 1]]
+            tf = self.tfs[self.ptr[i]:self.ptr[i + 1]]
+            out[docs] += self.idf[i] * tf * (BM25_K1 + 1) / (tf + norm[docs])
+        return out
+
+    def search(self, query: str, k: int = 6) -> list[dict]:
+        """スコアの高い区間を最大 k 件（スコアが 0 のものは返さない）。戻り値は時系列順"""
+        scores = self.scores(query)
+        top = np.argsort(-scores, kind="stable")[:k]
+        hits = [
+            {"text": self.chunks.text_at(int(i)), "start": self.chunks.starts[int(i)],
+             "end": self.chunks.starts[int(i)] + self.chunks.durations[int(i)], "score": float(scores[i])}
+            for i in top if scores[i] > 0
+        ]
+        return sorted(hits, key=lambda h: h["start"])
+
+    def to_bytes(self) -> bytes:
+        buf = io.BytesIO()
+        np.savez_compressed(
+            buf, version=np.array([INDEX_VERSION]), ptr=self.ptr, docs=self.docs, tfs=self.tfs,
+            doc_len=self.doc_len, chunks=np.frombuffer(self.chunks.to_bytes(), dtype=np.uint8),
+            vocab=np.frombuffer(json.dumps(list(self.vocab), ensure_ascii=False).encode("utf-8"), dtype=np.uint8),
+        )
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BM25Index":
+        z = np.load(io.BytesIO(data))
+        if int(z["version"][0]) != INDEX_VERSION:
+            raise ValueError("インデックスの形式が古いため読み込めません")
+        terms = json.loads(z["vocab"].tobytes().decode("utf-8"))
+        return cls(Transcript.from_bytes(z["chunks"].tobytes()), {t: i for i, t in enumerate(terms)},
+                   z["ptr"], z["docs"], z["tfs"], z["doc_len"])
+
+
+def index_key(transcript) -> str:
+    """
+    字幕の内容から決まるキー（同じ動画でも字幕が伸びれば別のインデックスになる）
+    Transcript なら結果を持たせておき、同じ字幕への2回目以降の質問ではハッシュし直さない
+    """
+    if isinstance(transcript, Transcript) and transcript._index_key is not None:
+        return transcript._index_key
+    h = hashlib.sha256()
+    for seg in transcript:
+        h.update(f"{seg['start']:.3f}\x1f{seg['text']}\x1e".encode("utf-8"))
+    key = f"bm25:v{INDEX_VERSION}:{h.hexdigest()[:32]}"
+    if isinstance(transcript, Transcript):
+        transcript._index_key = key
+    return key
+
+
+def get_index(transcript, use_cache: bool = True) -> BM25Index:
+    """字幕の検索インデックスを返す。字幕キャッシュの DB にあれば読み、なければ作って保存する"""
+    if not use_cache:
+        with metrics.span("index_build"):
+            return BM25Index.build(transcript)
+
+    # 字幕キャッシュと同じ DB・同じ期限で持つ
+    from transcript import transcript_cache
+    cache = transcript_cache()
+    key = index_key(transcript)
+    entry = cache.get(key)
+    if entry is not None and not entry.negative:
+        try:
+            index = BM25Index.from_bytes(entry.value)
+            metrics.annotate(index_cache="hit")
+            return index
+        except Exception as e:
+            logger.warning(f"インデックスの読み込みに失敗したので作り直します: {str(e)}")
+    metrics.annotate(index_cache="miss")
+    with metrics.span("index_build"):
+        index = BM25Index.build(transcript)
+    cache.put(key, index.to_bytes())
+    return index
+
+
+def format_hits(hits: list[dict]) -> str:
+    """LLM に渡す・画面に出す用の時刻付きテキスト"""
+    return "\n\n".join(
+        f"〈{format_timestamp(h['start'])}-{format_timestamp(h['end'])}〉 {h['text']}" for h in hits
+    )
@@ -0,0 +1,209 @@
+# segments.py
+"""
+字幕のコンパクトな表現
+・start / duration は float の配列、テキストは1本の文字列＋各セグメントの開始位置（オフセット）
+・セグメントごとに dict を持たないので、長時間の動画でもオブジェクト数がほぼ一定
+・transcript[i]["text"] のように従来の list[dict] と同じ書き方で読める（読み取り専用）
+・to_bytes() / from_bytes() でキャッシュ用のバイナリに変換する
+・to_json() / to_text() / to_srt() で書き出す
+"""
+from array import array
+from collections.abc import Mapping, Sequence
+from itertools import accumulate, islice
+from typing import Iterable, Iterator
+import json, struct, sys, zlib
+
+_MAGIC = b"YTT1"
+_HEADER = struct.Struct("<4sI")     # マジック, セグメント数
+_KEYS = ("text", "start", "duration")
+
+
+class Segment(Mapping):
+    """Transcript の i 番目のセグメントを dict のように見せるビュー"""
+    __slots__ = ("_tr", "_i")
+
+    def __init__(self, tr: "Transcript", i: int):
+        self._tr = tr
+        self._i = i
+
+    def __getitem__(self, key: str):
+        if key == "text":
+            return self._tr.text_at(self._i)
+        if key == "start":
+            return self._tr.starts[self._i]
+        if key == "duration":
+            return self._tr.durations[self._i]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(_KEYS)
+
+    def __len__(self):
+        return len(_KEYS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class Transcript(Sequence):
+    """
+    字幕（セグメントの列）。list[dict] の代わりにそのまま渡せる
+    書き換えが必要な処理は to_list() で dict のリストにしてから行う
+    """
+    __slots__ = ("starts", "durations", "offsets", "text", "_index_key")
+
+    def __init__(self, starts: array, durations: array, offsets: array, text: str):
+        self.starts = starts          # array('d')
+        self.durations = durations    # array('d')
+        self.offsets = offsets        # array('I')、len = セグメント数 + 1
+        self.text = text
+        self._index_key = None        # retrieval.index_key の結果（内容は変わらないので1度だけ計算する）
+
+    @classmethod
+    def from_segments(cls, segments: Iterable[Mapping]) -> "Transcript":
+        """dict（または同じキーを持つもの）の列から作る。ジェネレータも1回の走査で読める"""
+        if isinstance(segments, Transcript):
+            return segments
+        if isinstance(segments, list):
+            # すでに全件あるなら列ごとにまとめて作る方が速い
+            texts = [seg["text"] for seg in segments]
+            return cls(
+                array("d", [float(seg["start"]) for seg in segments]),
+                array("d", [float(seg["duration"]) for seg in segments]),
+                array("I", accumulate(map(len, texts), initial=0)),
+                "".join(texts),
+            )
+        starts, durations, offsets = array("d"), array("d"), array("I", [0])
+        texts = []
+        pos = 0
+        for seg in segments:
+            text = seg["text"]
+            texts.append(text)
+            pos += len(text)
+            offsets.append(pos)
+            starts.append(float(seg["start"]))
+            durations.append(float(seg["duration"]))
+        return cls(starts, durations, offsets, "".join(texts))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            first, last, step = i.indices(len(self))
+            if step != 1:
+                return Transcript.from_segments(self[j] for j in range(first, last, step))
+            base = self.offsets[first] if first < last else 0
+            return Transcript(
+                self.starts[first:last],
+                self.durations[first:last],
+                array("I", (o - base for o in self.offsets[first:last + 1])) if first < last else array("I", [0]),
+                self.text[base:self.offsets[last]] if first < last else "",
+            )
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("transcript index out of range")
+        return Segment(self, i)
+
+    def __iter__(self) -> Iterator[Segment]:
+        for i in range(len(self)):
+            yield Segment(self, i)
+
+    def __eq__(self, other):
+        if isinstance(other, Transcript):
+            return (self.text == other.text and self.offsets == other.offsets
+                    and self.starts == other.starts and self.durations == other.durations)
+        if isinstance(other, Sequence):
+            return len(self) == len(other) and all(dict(a) == dict(b) for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"Transcript({len(self)} segments, {len(self.text)} chars)"
+
+    def text_at(self, i: int) -> str:
+        return self.text[self.offsets[i]:self.offsets[i + 1]]
+
+    def texts(self) -> Iterator[str]:
+        """各セグメントのテキスト（ビューを作らない分 iter より速い）"""
+        text, offsets = self.text, self.offsets
+        return (text[a:b] for a, b in zip(offsets, islice(offsets, 1, None)))
+
+    def joined(self, sep: str = "\n") -> str:
+        return sep.join(self.texts())
+
+    def to_list(self) -> list[dict]:
+        """従来どおりの list[dict]（JSON 出力や書き換えが必要な処理向け）"""
+        return [
+            {"text": t, "start": s, "duration": d}
+            for t, s, d in zip(self.texts(), self.starts, self.durations)
+        ]
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_list(), ensure_ascii=False, **kwargs)
+
+    def to_text(self) -> str:
+        """テキストだけを1行1セグメントで"""
+        return self.joined("\n")
+
+    def to_srt(self) -> str:
+        """SubRip（.srt）形式"""
+        return "".join(
+            f"{n}\n{_srt_time(s)} --> {_srt_time(s + d)}\n{t}\n\n"
+            for n, (t, s, d) in enumerate(zip(self.texts(), self.starts, self.durations), 1)
+        )
+
+    def find(self, query: str) -> list[int]:
+        """query を含むセグメントの番号（大文字・小文字は区別しない）"""
+        query = query.lower()
+        return [i for i, t in enumerate(self.texts()) if query in t.lower()]
+
+    def nbytes(self) -> int:
+        """データ本体の大きさ（配列のバッファとテキスト）"""
+        return (sys.getsizeof(self.text) + sum(
+            a.itemsize * len(a) for a in (self.starts, self.durations, self.offsets)))
+
+    def to_bytes(self) -> bytes:
+        """
+        キャッシュ用のバイナリ: ヘッダ + start / duration（float64）+ オフセット（uint32）+ UTF-8 テキスト
+        全体を zlib（速さ優先のレベル1）で圧縮する
+        """
+        parts = [_HEADER.pack(_MAGIC, len(self))]
+        for a in (self.starts, self.durations, self.offsets):
+            if sys.byteorder == "big":
+                a = array(a.typecode, a)
+                a.byteswap()
+            parts.append(a.tobytes())
+        parts.append(self.text.encode("utf-8"))
+        return _MAGIC + zlib.compress(b"".join(parts), 1)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Transcript":
+        if not is_packed(data):
+            raise ValueError("Transcript のバイナリ形式ではありません")
+        raw = zlib.decompress(memoryview(data)[len(_MAGIC):])
+        magic, n = _HEADER.unpack_from(raw)
+        pos = _HEADER.size
+        arrays = []
+        for typecode, count in (("d", n), ("d", n), ("I", n + 1)):
+            a = array(typecode)
+            size = a.itemsize * count
+            a.frombytes(raw[pos:pos + size])
+            if sys.byteorder == "big":
+                a.byteswap()
+            arrays.append(a)
+            pos += size
+        return cls(*arrays, raw[pos:].decode("utf-8"))
+
+
+def _srt_time(seconds: float) -> str:
+    ms = round(seconds * 1000)
+    h, rem = divmod(ms, 3_600_000)
+    m, rem = divmod(rem, 60_000)
+    s, ms = divmod(rem, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+
+def is_packed(data: bytes) -> bool:
+    """to_bytes() で作ったデータか（キャッシュにある古い JSON 形式と見分ける）"""
+    return bytes(data[:len(_MAGIC)]) == _MAGIC
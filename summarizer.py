@@ -1,75 +1,741 @@
 # summarizer.py
 from pathlib import Path
-from typing import List
-import json, os, tiktoken, google.generativeai as genai
-from openai import OpenAI, OpenAIError
+from typing import Callable, Iterable, Iterator, List, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from dataclasses import dataclass
+from datetime import timedelta
+from itertools import chain
+import contextvars, hashlib, json, logging, os, threading, time
 from enum import Enum
+from cache import DiskCache, CACHE_DIR
+from compaction import compact_transcript
+from tokens import count_tokens, get_encoder
+from ratelimit import DeadlineExceeded, RateLimiter, call_with_backoff, is_quota_error
+import metrics
+
+logger = logging.getLogger(__name__)
 
 class Backend(Enum):
     GEMINI = "gemini"
+    EXTRACTIVE = "extractive"   # LLM を使わない抽出型要約（オフライン）
+
+GEMINI_MODEL = "gemini-2.0-flash"
+
+DEFAULT_PROMPT = """以下のテキストを要約してください。
+            ・重要なポイントを箇条書きで
+            ・簡潔に、かつ内容を維持して
+            ・日本語で出力"""
+
+# 要約キャッシュの設定（SUMMARY_CACHE=0 で無効化）
+SUMMARY_CACHE_ENABLED = os.getenv("SUMMARY_CACHE", "1") != "0"
+SUMMARY_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", 30 * 24 * 3600))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", 20000))
+SUMMARY_CACHE_MAX_BYTES = int(os.getenv("SUMMARY_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+
+# Gemini がレート制限・クォータ超過で失敗したら抽出型要約で代替する（EXTRACTIVE_FALLBACK=0 で無効化）
+EXTRACTIVE_FALLBACK = os.getenv("EXTRACTIVE_FALLBACK", "1") != "0"
+FALLBACK_NOTICE = "※ Gemini が混み合っているため、抽出型の簡易要約を表示しています。\n\n"
+
+# 複数プリセットの同時要約で、字幕をモデル側のコンテキストキャッシュに載せる条件
+# （トークン数が少ないとキャッシュを作れない／割に合わないので、それ未満は毎回字幕ごと送る）
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", 32_768))
+CONTEXT_CACHE_TTL_MINUTES = float(os.getenv("CONTEXT_CACHE_TTL_MINUTES", 10))
+
+# LLM に渡す前に字幕を圧縮する（COMPACT_TRANSCRIPT=0 で無効化）
+COMPACT_TRANSCRIPT = os.getenv("COMPACT_TRANSCRIPT", "1") != "0"
+
+# 長尺動画用 map-reduce 要約の設定
+MAP_REDUCE_THRESHOLD_TOKENS = int(os.getenv("MAP_REDUCE_THRESHOLD_TOKENS", 100_000))
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", 8000))
+MAP_CONCURRENCY = int(os.getenv("MAP_CONCURRENCY", 4))
+
+MAP_PROMPT = """\
+以下は長い動画の書き起こしの一部です。
+後で全体の要約に統合するため、重要な事実・主張・数値・固有名詞を漏らさず
+箇条書きで簡潔に要約してください。前置きは不要です。
+"""
+
+REDUCE_PROMPT = """\
+以下は同じ動画の書き起こしを分割して要約したものです（時系列順）。
+重複をまとめ、流れと重要な情報を保ったまま一つの箇条書き要約に統合してください。
+"""
+
+ROLLING_PROMPT = """\
+以下は配信中の動画について、これまでの要約と、その後に追加された書き起こしです。
+これまでの要約の構成と内容を保ったまま、新しい書き起こしの内容を反映した要約に更新してください。
+出力は更新後の要約だけにしてください。
+"""
+
+ANSWER_PROMPT = """\
+以下は動画の書き起こしから、質問に関係しそうな部分を抜き出したものです（〈開始-終了〉は動画内の時刻）。
+この内容だけを根拠に、質問に日本語で簡潔に答えてください。
+根拠にした箇所の時刻を〈mm:ss〉の形で添えてください。
+書き起こしに答えが無い場合は「動画内では触れられていないようです」と答えてください。
+"""
+# 質問ごとに LLM に渡す区間の数
+ANSWER_TOP_K = int(os.getenv("ANSWER_TOP_K", 6))
+
+_summary_cache = None
+
+# Gemini のレート制限（1分あたりのリクエスト数・トークン数）と1回の呼び出しの締め切り（秒）
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", 60))
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", 1_000_000))
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", 120))
+# 出力トークン数の見積もり（入力と合わせて TPM の枠を確保する）
+EXPECTED_OUTPUT_TOKENS = 1024
+
+# 単発要約・map-reduce・バッチのすべての呼び出しで共有する
+rate_limiter = RateLimiter(GEMINI_RPM, GEMINI_TPM)
 
-_oa_client = OpenAI()
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+# バックエンドごとのクライアント／モデルは初回利用時に生成して使い回す
+_backend_factories: dict[Backend, Callable[[], object]] = {}
+_backend_models: dict[Backend, object] = {}
+_backend_lock = threading.Lock()
+
+def register_backend(backend: Backend, factory: Callable[[], object]):
+    """バックエンドの生成関数を登録する（生成済みのものは破棄）"""
+    with _backend_lock:
+        _backend_factories[backend] = factory
+        _backend_models.pop(backend, None)
+
+def get_model(backend: Backend):
+    """バックエンドのモデルを返す。初回だけ生成し、以降はキャッシュを返す"""
+    model = _backend_models.get(backend)
+    if model is not None:
+        return model
+    with _backend_lock:
+        if backend not in _backend_models:
+            if backend not in _backend_factories:
+                raise ValueError(f"Unsupported backend: {backend}")
+            _backend_models[backend] = _backend_factories[backend]()
+        return _backend_models[backend]
+
+def _gemini_factory():
+    # google.generativeai の import は重いので初回利用時まで遅らせる
+    import google.generativeai as genai
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    return genai.GenerativeModel(GEMINI_MODEL)
+
+def _extractive_factory():
+    # NumPy の import を抽出型要約を使うときまで遅らせる
+    import extractive
+    return extractive
+
+register_backend(Backend.GEMINI, _gemini_factory)
+register_backend(Backend.EXTRACTIVE, _extractive_factory)
+
+# 同じ字幕に複数のプロンプトを投げるときに、字幕をモデル側にキャッシュして共有する
+# factory(text) は (text を前提に持つモデル, 後始末の関数) を返す
+_context_factories: dict[Backend, Callable[[str], tuple[object, Callable[[], None]]]] = {}
+
+def register_context_cache(backend: Backend, factory: Callable[[str], tuple[object, Callable[[], None]]]):
+    """バックエンドのコンテキストキャッシュの作り方を登録する"""
+    with _backend_lock:
+        _context_factories[backend] = factory
+
+def _gemini_context_factory(text: str):
+    import google.generativeai as genai
+    from google.generativeai import caching
+    cached = caching.CachedContent.create(
+        model=f"models/{GEMINI_MODEL}",
+        contents=[text],
+        ttl=timedelta(minutes=CONTEXT_CACHE_TTL_MINUTES),
+    )
+    return genai.GenerativeModel.from_cached_content(cached_content=cached), cached.delete
+
+register_context_cache(Backend.GEMINI, _gemini_context_factory)
+
+def _collect_metrics():
+    """レート制限・要約キャッシュの統計を Prometheus 出力に載せる"""
+    for k, v in rate_limiter.metrics().items():
+        yield f"yt_summarizer_rate_limiter_{k}", {"backend": Backend.GEMINI.value}, v
+    if _summary_cache is not None:
+        for k, v in _summary_cache.stats().items():
+            yield f"yt_summarizer_cache_{k}", {"cache": "summary"}, v
+
+metrics.register_collector(_collect_metrics)
+
+@dataclass
+class Chunk:
+    text: str
+    start: float    # 最初のセグメントの開始（秒）
+    end: float      # 最後のセグメントの終了（秒）
+    tokens: int
+    last: bool = False  # 字幕の最後のチャンクか
+
+def _chunk(transcript: List[dict], limit_tokens: int, overlap_tokens: int = 0) -> List[Chunk]:
+    """
+    字幕を limit_tokens 以内のチャンクに分ける（セグメントの途中では切らない）
+    overlap_tokens > 0 なら、直前のチャンク末尾のセグメントをその範囲で次のチャンクの先頭に重ねる
+    """
+    if not transcript:
+        return []
+    texts = [seg["text"] for seg in transcript]
+    counts = [len(t) for t in get_encoder().encode_ordinary_batch(texts)]
+
+    out = []
+    first, tok = 0, 0
+    for i, n in enumerate(counts):
+        if tok + n > limit_tokens and i > first:
+            out.append(_make_chunk(transcript, texts, first, i, tok))
+            # 重ねる分だけ開始位置を戻す（チャンク全体を重ねることはしない）
+            back, back_tok = i, 0
+            while (back - 1 > first and back_tok + counts[back - 1] <= overlap_tokens
+                   and back_tok + counts[back - 1] + n <= limit_tokens):
+                back -= 1
+                back_tok += counts[back]
+            first, tok = back, back_tok
+        tok += n
+    out.append(_make_chunk(transcript, texts, first, len(texts), tok))
+    out[-1].last = True
+    return out
 
-def _chunk(transcript: List[dict], limit_tokens: int) -> List[str]:
-    enc = tiktoken.get_encoding("cl100k_base")
-    buf, tok, out = [], 0, []
-    for seg in transcript:
-        t = enc.encode(seg["text"])
-        if tok + len(t) > limit_tokens and buf:
-            out.append(" ".join(buf))
+def iter_chunks(segments: Iterable[Mapping], limit_tokens: int = CHUNK_TOKENS,
+                compact: bool = COMPACT_TRANSCRIPT) -> Iterator[Chunk]:
+    """
+    _chunk のストリーミング版。セグメントを1つずつ読み、limit_tokens を超える手前でチャンクを返す
+    手元に持つのは作りかけのチャンク1つ分だけ。compact なら切り出したチャンクごとに圧縮する
+    """
+    encoder = get_encoder()
+    buf, tok = [], 0
+    for seg in segments:
+        n = len(encoder.encode_ordinary(seg["text"]))
+        if buf and tok + n > limit_tokens:
+            yield _chunk_of(buf, tok, compact)
             buf, tok = [], 0
-        buf.append(seg["text"])
-        tok += len(t)
+        buf.append(seg)
+        tok += n
     if buf:
-        out.append(" ".join(buf))
-    return out
+        yield _chunk_of(buf, tok, compact, last=True)
 
-def _llm_call(text: str, backend: Backend, prompt: str) -> str:
-    if backend == Backend.GEMINI:
-        res = genai.GenerativeModel("gemini-2.0-flash").generate_content(f"{prompt}\n\n{text}")
-        return res.text.strip()
-    else:
-        raise ValueError(f"Unsupported backend: {backend}")
+def _chunk_of(segments: list, tok: int, compact: bool, last: bool = False) -> Chunk:
+    start = float(segments[0]["start"])
+    end = float(segments[-1]["start"]) + float(segments[-1]["duration"])
+    if compact:
+        # 圧縮前のトークン数はここまでで数えてあるので、数えるのは圧縮後だけ
+        segments, stats = compact_transcript(segments, tokens_before=tok)
+        tok = stats["tokens_after"]
+    return Chunk(text=" ".join(seg["text"] for seg in segments), start=start, end=end, tokens=tok, last=last)
+
+def _make_chunk(transcript: List[dict], texts: List[str], first: int, last: int, tok: int) -> Chunk:
+    end_seg = transcript[last - 1]
+    return Chunk(
+        text=" ".join(texts[first:last]),
+        start=float(transcript[first]["start"]),
+        end=float(end_seg["start"]) + float(end_seg["duration"]),
+        tokens=tok,
+    )
+
+def _generate(backend: Backend, content: str, stream: bool = False, timeout: float = LLM_CALL_TIMEOUT,
+              model=None, context_tokens: int = 0):
+    """
+    モデル呼び出しの共通入口。レート制限の枠を確保し、クォータ超過ならバックオフして再試行する
+    timeout は待ち時間も含めた締め切り（秒）
+    model を渡すとそれを使う（共有コンテキストに紐づいたモデルなど）
+    context_tokens: content 以外に入力として数えられるトークン数（コンテキストキャッシュに載せた字幕など）
+    stream=True では最初のチャンクを受け取るまでを再試行の対象にする
+    （出力が始まった後のクォータ超過は再試行せずにそのまま例外になる）
+    """
+    model = model or get_model(backend)
+    deadline = time.monotonic() + timeout
+    tokens = count_tokens(content) + context_tokens + EXPECTED_OUTPUT_TOKENS
+
+    def call(remaining: float | None):
+        res = model.generate_content(content, stream=stream, request_options={"timeout": remaining})
+        return _first_chunk(res) if stream else res
+
+    with metrics.span("llm", backend=backend.value, stream=stream):
+        return call_with_backoff(call, rate_limiter, tokens, deadline)
+
+def _first_chunk(stream) -> Iterator:
+    """ストリームの最初のチャンクまで読み、読んだチャンクを先頭に戻したイテレータを返す"""
+    it = iter(stream)
+    first = next(it, None)
+    return it if first is None else chain([first], it)
+
+def _record_usage(res, backend: Backend = Backend.GEMINI):
+    """レスポンスの usage_metadata から入出力トークン数を記録する"""
+    usage = getattr(res, "usage_metadata", None)
+    if usage is None:
+        return
+    input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    metrics.inc("yt_summarizer_llm_tokens_total", input_tokens, backend=backend.value, kind="input")
+    metrics.inc("yt_summarizer_llm_tokens_total", output_tokens, backend=backend.value, kind="output")
+    metrics.accumulate(input_tokens=input_tokens, output_tokens=output_tokens)
+
+def _response_text(res) -> str:
+    """
+    レスポンス（ストリームのチャンク）のテキスト
+    安全性フィルタで止まった・終了の通知だけなど、テキストの part が無いと .text は ValueError になるので空文字にする
+    """
+    try:
+        return res.text or ""
+    except (ValueError, AttributeError):
+        return ""
+
+def _require_text(res) -> str:
+    text = _response_text(res)
+    if not text.strip():
+        candidates = getattr(res, "candidates", None) or []
+        reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+        raise Exception(f"モデルの応答にテキストがありません（finish_reason={reason}）")
+    return text
+
+def _llm_call(text: str, backend: Backend, prompt: str, model=None, context_tokens: int = 0) -> str:
+    res = _generate(backend, f"{prompt}\n\n{text}" if text else prompt, model=model, context_tokens=context_tokens)
+    _record_usage(res, backend)
+    return _require_text(res).strip()
 
 def generate_summary_with_gemini(text: str, prompt: str = None) -> str:
     """
     Geminiを使用してテキストを要約する
     """
     try:
-        # Gemini APIの設定
-        genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-        
-        # モデルの設定
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        
         # プロンプトの準備
         if prompt is None:
-            prompt = """以下のテキストを要約してください。
-            ・重要なポイントを箇条書きで
-            ・簡潔に、かつ内容を維持して
-            ・日本語で出力"""
+            prompt = DEFAULT_PROMPT
         
         # 要約の生成
-        response = model.generate_content(f"{prompt}\n\n{text}")
+        response = _generate(Backend.GEMINI, f"{prompt}\n\n{text}")
+        _record_usage(response)
         
-        return response.text
+        return _require_text(response)
         
     except Exception as e:
         raise Exception(f"要約の生成に失敗しました: {str(e)}")
 
-def summarize(transcript: list[dict], backend: Backend = Backend.GEMINI, prompt: str = None) -> str:
+def _group_by_tokens(texts: List[str], limit_tokens: int) -> List[List[str]]:
     """
-    字幕データを要約する
+    テキストを順序を保ったまま limit_tokens 以内のグループにまとめる
+    段数が必ず減るよう、1グループには最低2件入れる
+    """
+    groups, buf, tok = [], [], 0
+    for text in texts:
+        n = count_tokens(text)
+        if buf and len(buf) >= 2 and tok + n > limit_tokens:
+            groups.append(buf)
+            buf, tok = [], 0
+        buf.append(text)
+        tok += n
+    if buf:
+        if len(buf) == 1 and groups:
+            groups[-1].extend(buf)
+        else:
+            groups.append(buf)
+    return groups
+
+def _map_chunks(chunks: Iterable[Chunk], backend: Backend, chunk_tokens: int, concurrency: int,
+                on_partial: Callable[[int, Chunk, str], None] | None = None) -> List[str]:
+    """
+    チャンクを受け取った順に並列に要約（map）し、部分要約の合計が1リクエストに収まるまで階層的に統合する
+    要約中のチャンクは concurrency 個までで、それ以上は先に出したものが終わるまで次を読まない
+    （chunks がジェネレータなら、字幕の受信・パースもその分しか先行しない）
+    on_partial(番号, チャンク, 部分要約) は部分要約ができるたびにワーカースレッドから呼ばれる
+    """
+    def map_one(i: int, chunk: Chunk) -> str:
+        partial = _llm_call(chunk.text, backend, MAP_PROMPT)
+        if on_partial is not None:
+            on_partial(i, chunk, partial)
+        return partial
+
+    concurrency = max(1, concurrency)
+    partials, inflight = [], deque()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        for i, chunk in enumerate(chunks):
+            inflight.append(ex.submit(contextvars.copy_context().run, map_one, i, chunk))
+            while len(inflight) > concurrency:
+                partials.append(inflight.popleft().result())
+        while inflight:
+            partials.append(inflight.popleft().result())
+        if not partials:
+            raise ValueError("要約する字幕がありません")
+        metrics.annotate(chunks=len(partials))
+        while len(partials) > 1 and sum(count_tokens(p) for p in partials) > chunk_tokens:
+            groups = _group_by_tokens(partials, chunk_tokens)
+            partials = _map_in_context(ex, lambda g: _llm_call("\n\n".join(g), backend, REDUCE_PROMPT), groups)
+    return partials
+
+def _map_reduce_partials(transcript: list[dict], backend: Backend, chunk_tokens: int, concurrency: int) -> List[str]:
+    """長い字幕を chunk_tokens ごとに分割して _map_chunks にかける（最後の統合は呼び出し側で行う）"""
+    with metrics.span("chunk"):
+        chunks = _chunk(transcript, chunk_tokens)
+    return _map_chunks(chunks, backend, chunk_tokens, concurrency)
+
+def _map_in_context(ex: ThreadPoolExecutor, fn, items) -> list:
+    """ex.map と同じだが、計測の trace を引き継ぐため呼び出し元のコンテキストで実行する"""
+    futures = [ex.submit(contextvars.copy_context().run, fn, item) for item in items]
+    return [f.result() for f in futures]
+
+def summarize_map_reduce(transcript: list[dict], backend: Backend = Backend.GEMINI, prompt: str = None,
+                         chunk_tokens: int = CHUNK_TOKENS, concurrency: int = MAP_CONCURRENCY) -> str:
+    """
+    map-reduce で要約し、最後の統合でユーザーのプロンプトを適用する
     """
+    with metrics.span("chunk"):
+        chunks = _chunk(transcript, chunk_tokens)
+    return summarize_chunks(chunks, backend, prompt, chunk_tokens, concurrency)
+
+def summarize_chunks(chunks: Iterable[Chunk], backend: Backend = Backend.GEMINI, prompt: str = None,
+                     chunk_tokens: int = CHUNK_TOKENS, concurrency: int = MAP_CONCURRENCY,
+                     on_partial: Callable[[int, Chunk, str], None] | None = None,
+                     fallback: Callable[[], list[dict]] | None = None) -> str:
+    """
+    チャンクの列を map-reduce で要約し、最後の統合でユーザーのプロンプトを適用する
+    chunks はジェネレータでもよく、受け取った順に map 要約へ回す（_map_chunks）
+    チャンクが1つだけなら map はせず、ユーザーのプロンプトで直接要約する（on_partial はその要約で呼ぶ）
+    fallback: 字幕全体を返す関数。渡すとクォータ超過のときにその字幕で抽出型の代替要約を返す
+    """
+    if prompt is None:
+        prompt = DEFAULT_PROMPT
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is None:
+        raise ValueError("要約する字幕がありません")
+    try:
+        if first.last:
+            summary = _llm_call(first.text, backend, prompt)
+            if on_partial is not None:
+                on_partial(0, first, summary)
+            return summary
+        partials = _map_chunks(chain([first], chunks), backend, chunk_tokens, concurrency, on_partial)
+        return _llm_call("\n\n".join(partials), backend, f"{REDUCE_PROMPT}\n{prompt}")
+    except ValueError:
+        raise
+    except Exception as e:
+        if fallback is not None and EXTRACTIVE_FALLBACK and _rate_limited(e):
+            return _fallback_or_raise(e, fallback())
+        raise Exception(f"要約の生成に失敗しました: {str(e)}")
+
+def update_summary(previous: str, delta: list[dict], backend: Backend = Backend.GEMINI,
+                   prompt: str = None, compact: bool = COMPACT_TRANSCRIPT) -> str:
+    """
+    これまでの要約 previous に、追加分の字幕 delta の内容を反映した要約を返す
+    LLM に送るのは previous と delta だけなので、コストは追加分の長さに比例する
+    delta が1チャンクに収まらなければ、先に delta を map で部分要約してから反映する
+    """
+    if backend == Backend.EXTRACTIVE:
+        raise ValueError("抽出型要約は差分の反映に対応していません")
+    if prompt is None:
+        prompt = DEFAULT_PROMPT
+    if compact:
+        delta = _compact(delta)
+    text = "\n".join([t["text"] for t in delta])
+    if not previous:
+        return summarize(delta, backend=backend, prompt=prompt, use_cache=False, compact=False)
+    try:
+        if count_tokens(text) > CHUNK_TOKENS:
+            text = "\n\n".join(_map_reduce_partials(delta, backend, CHUNK_TOKENS, MAP_CONCURRENCY))
+        content = f"■ これまでの要約\n{previous}\n\n■ 新しい書き起こし\n{text}"
+        return _llm_call(content, backend, f"{ROLLING_PROMPT}\n{prompt}")
+    except Exception as e:
+        raise Exception(f"要約の生成に失敗しました: {str(e)}")
+
+def answer(transcript: list[dict], question: str, backend: Backend = Backend.GEMINI,
+           k: int = ANSWER_TOP_K, use_cache: bool = True) -> tuple[str, list[dict]]:
+    """
+    動画についての質問に答える。字幕全体ではなく、検索で選んだ上位 k 区間だけを LLM に送る
+    検索インデックスは字幕ごとに1度だけ作り、字幕キャッシュと一緒に保存する
+    戻り値: (回答, 根拠にした区間のリスト)
+    """
+    import retrieval
+    with metrics.span("retrieve"):
+        hits = retrieval.get_index(transcript, use_cache=use_cache).search(question, k)
+    metrics.annotate(retrieved_chunks=len(hits))
+    if not hits:
+        return "動画内では触れられていないようです（関連する箇所が見つかりませんでした）。", []
+    context = retrieval.format_hits(hits)
+    if backend == Backend.EXTRACTIVE:
+        # LLM を使わない場合は関連箇所をそのまま返す
+        return context, hits
+    try:
+        return _llm_call(f"■ 質問\n{question}\n\n■ 書き起こし（抜粋）\n{context}", backend, ANSWER_PROMPT), hits
+    except Exception as e:
+        raise Exception(f"回答の生成に失敗しました: {str(e)}")
+
+def generate_summary_stream_with_gemini(text: str, prompt: str = None) -> Iterator[str]:
+    """
+    Geminiの出力を逐次（テキスト差分ごとに）返す
+    """
+    if prompt is None:
+        prompt = DEFAULT_PROMPT
+    try:
+        chunk = None
+        produced = False
+        # llm は最初のチャンクまで、llm_stream は出力の最後までの時間
+        with metrics.span("llm_stream", backend=Backend.GEMINI.value):
+            for chunk in _generate(Backend.GEMINI, f"{prompt}\n\n{text}", stream=True):
+                # テキストの無いチャンク（終了の通知など）は読み飛ばす
+                delta = _response_text(chunk)
+                if delta:
+                    produced = True
+                    yield delta
+        # 最後のチャンクに全体の usage_metadata が入る
+        _record_usage(chunk)
+        if not produced:
+            _require_text(chunk)
+    except Exception as e:
+        raise Exception(f"要約の生成に失敗しました: {str(e)}")
+
+def summary_cache() -> DiskCache:
+    """プロセス共通の要約キャッシュを返す（CLI と Streamlit で同じファイルを共有）"""
+    global _summary_cache
+    if _summary_cache is None:
+        _summary_cache = DiskCache(
+            CACHE_DIR / "summaries.sqlite3",
+            ttl=SUMMARY_CACHE_TTL,
+            max_entries=SUMMARY_CACHE_MAX_ENTRIES,
+            max_bytes=SUMMARY_CACHE_MAX_BYTES,
+        )
+    return _summary_cache
+
+def _summary_key(text: str, prompt: str, backend: Backend, model: str) -> str:
+    """(字幕ハッシュ, 正規化プロンプトのハッシュ, バックエンド/モデル) からキーを作る"""
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    # 空白・改行の違いだけのプロンプトは同一視する
+    normalized = " ".join(prompt.split())
+    prompt_hash = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+    return f"{backend.value}:{model}:{text_hash}:{prompt_hash}"
+
+def _summarize_extractive(transcript: list[dict]) -> str:
+    with metrics.span("extractive"):
+        return get_model(Backend.EXTRACTIVE).summarize(transcript)
+
+def _rate_limited(e: BaseException) -> bool:
+    """例外（包み直される前のものも含めて）がレート制限・クォータ超過によるものか"""
+    while e is not None:
+        if isinstance(e, DeadlineExceeded) or is_quota_error(e):
+            return True
+        e = e.__cause__ or e.__context__
+    return False
+
+def _lookup_summary(key: str) -> str | None:
+    entry = summary_cache().get(key)
+    hit = entry is not None and not entry.negative
+    metrics.inc("yt_summarizer_cache_lookups_total", cache="summary", result="hit" if hit else "miss")
+    metrics.annotate(summary_cache="hit" if hit else "miss")
+    return entry.value.decode("utf-8") if hit else None
+
+def _compact(transcript: list[dict], backend: Backend = Backend.GEMINI) -> list[dict]:
+    # トークン数は計測の属性にしか使わないので、trace の外では数えない
+    # 抽出型はオフラインでも動くよう tiktoken を使わない（エンコーダのダウンロードが要る）
+    tracing = metrics.current_trace() is not None and backend != Backend.EXTRACTIVE
+    with metrics.span("compact"):
+        transcript, stats = compact_transcript(transcript, token_stats=tracing)
+    if tracing:
+        metrics.annotate(tokens_before_compaction=stats["tokens_before"], tokens_after_compaction=stats["tokens_after"])
+    return transcript
+
+@dataclass
+class _Prepared:
+    """summarize() / summarize_stream() の共通の前処理の結果"""
+    transcript: list
+    text: str = ""
+    prompt: str = ""
+    mode: str = ""
+    key: str | None = None      # 要約を書き込むキャッシュのキー（キャッシュを使わないなら None）
+    ready: str | None = None    # キャッシュ・抽出型ですでにできている要約
+
+def _prepare(transcript: list[dict], backend: Backend, prompt: str | None, use_cache: bool,
+             mode: str, compact: bool) -> _Prepared:
+    """圧縮 → キャッシュのキー → キャッシュの参照 → 要約方式の決定"""
+    if compact:
+        transcript = _compact(transcript, backend)
+    if backend == Backend.EXTRACTIVE:
+        # 数十ミリ秒で終わるのでキャッシュしない。プロンプトは使わない
+        return _Prepared(transcript, ready=_summarize_extractive(transcript))
     # 字幕テキストを結合
     text = "\n".join([t["text"] for t in transcript])
-    
-    # 要約生成
-    if backend == Backend.GEMINI:
-        # Geminiを使用した要約
-        summary = generate_summary_with_gemini(text, prompt)
-    else:
+    if prompt is None:
+        prompt = DEFAULT_PROMPT
+
+    key = None
+    if use_cache and SUMMARY_CACHE_ENABLED:
+        key = _summary_key(text, prompt, backend, GEMINI_MODEL)
+        cached = _lookup_summary(key)
+        if cached is not None:
+            return _Prepared(transcript, text, prompt, ready=cached)
+
+    if mode == "auto":
+        mode = "map_reduce" if count_tokens(text) > MAP_REDUCE_THRESHOLD_TOKENS else "single"
+    metrics.annotate(summary_mode=mode)
+    if backend != Backend.GEMINI:
         raise ValueError(f"Unsupported backend: {backend}")
+    return _Prepared(transcript, text, prompt, mode, key)
+
+def _fallback(e: Exception, transcript: list[dict]) -> str | None:
+    """クォータ超過なら抽出型の代替要約（キャッシュしない）を返す。代替しない例外なら None"""
+    if not (EXTRACTIVE_FALLBACK and _rate_limited(e)):
+        return None
+    logger.warning(f"レート制限のため抽出型要約で代替します: {str(e)}")
+    return FALLBACK_NOTICE + _summarize_extractive(transcript)
+
+def _fallback_or_raise(e: Exception, transcript: list[dict]) -> str:
+    """_fallback と同じだが、代替しない例外はそのまま投げ直す"""
+    summary = _fallback(e, transcript)
+    if summary is None:
+        raise e
+    return summary
+
+def summarize(transcript: list[dict], backend: Backend = Backend.GEMINI, prompt: str = None,
+              use_cache: bool = True, mode: str = "auto", compact: bool = COMPACT_TRANSCRIPT) -> str:
+    """
+    字幕データを要約する
+    SUMMARY_CACHE=0 のときは use_cache に関わらずキャッシュを使わない
+    mode: "auto"（MAP_REDUCE_THRESHOLD_TOKENS 超で map-reduce）/ "single" / "map_reduce"
+    compact: 重なり・フィラーを除いて文単位にまとめてから LLM に渡す
+    """
+    req = _prepare(transcript, backend, prompt, use_cache, mode, compact)
+    if req.ready is not None:
+        return req.ready
+
+    # 要約生成
+    try:
+        if req.mode == "map_reduce":
+            summary = summarize_map_reduce(req.transcript, backend, req.prompt)
+        else:
+            # Geminiを使用した要約
+            summary = generate_summary_with_gemini(req.text, req.prompt)
+    except Exception as e:
+        # 代替の要約はキャッシュしない（次回は Gemini で要約する）
+        return _fallback_or_raise(e, req.transcript)
+
+    if req.key is not None:
+        summary_cache().put(req.key, summary.encode("utf-8"))
     
     return summary
+
+def _open_context(backend: Backend, text: str):
+    """字幕を共有コンテキストとしてモデル側にキャッシュする。できなければ None"""
+    factory = _context_factories.get(backend)
+    if factory is None:
+        return None
+    try:
+        with metrics.span("context_cache"):
+            return factory(text)
+    except Exception as e:
+        logger.warning(f"コンテキストキャッシュを作れなかったので字幕ごと送ります: {str(e)}")
+        return None
+
+def summarize_many(transcript: list[dict], prompts: dict[str, str], backend: Backend = Backend.GEMINI,
+                   use_cache: bool = True, compact: bool = COMPACT_TRANSCRIPT,
+                   concurrency: int | None = None) -> dict[str, str]:
+    """
+    1つの字幕を複数のプロンプト（プリセット）で同時に要約する。戻り値は {名前: 要約}
+    字幕の圧縮・結合（長尺なら map-reduce の部分要約）は1回だけ行い、各プロンプトは並列に呼ぶので
+    全体の時間は最も遅いプロンプト1回分に近づく
+    字幕が CONTEXT_CACHE_MIN_TOKENS 以上ならモデル側のコンテキストキャッシュで字幕を共有する
+    キャッシュのキーは summarize() と同じなので、単独で要約した結果も使い回される
+    クォータ超過で失敗したプリセットは summarize() と同じく抽出型の代替要約になる
+    """
+    if compact:
+        transcript = _compact(transcript, backend)
+    if backend == Backend.EXTRACTIVE:
+        summary = _summarize_extractive(transcript)
+        return {name: summary for name in prompts}
+    text = "\n".join([t["text"] for t in transcript])
+    use_cache = use_cache and SUMMARY_CACHE_ENABLED
+
+    results, keys = {}, {}
+    for name, prompt in prompts.items():
+        keys[name] = _summary_key(text, prompt, backend, GEMINI_MODEL)
+        cached = _lookup_summary(keys[name]) if use_cache else None
+        if cached is not None:
+            results[name] = cached
+    pending = [name for name in prompts if name not in results]
+    if not pending:
+        return results
+
+    tokens = count_tokens(text)
+    mode = "map_reduce" if tokens > MAP_REDUCE_THRESHOLD_TOKENS else "single"
+    metrics.annotate(summary_mode=mode, presets=len(prompts))
+    source, prefix = text, ""
+    if mode == "map_reduce":
+        # 部分要約はプロンプトに依存しないので1回だけ作って使い回す
+        try:
+            source = "\n\n".join(_map_reduce_partials(transcript, backend, CHUNK_TOKENS, MAP_CONCURRENCY))
+        except Exception as e:
+            fallback = _fallback(e, transcript)
+            if fallback is None:
+                raise Exception(f"要約の生成に失敗しました: {str(e)}")
+            return {name: results.get(name, fallback) for name in prompts}
+        tokens, prefix = count_tokens(source), f"{REDUCE_PROMPT}\n"
+
+    context = None
+    if len(pending) > 1 and tokens >= CONTEXT_CACHE_MIN_TOKENS:
+        context = _open_context(backend, source)
+    metrics.annotate(context_cache=context is not None)
+
+    def run(name: str) -> str:
+        prompt = prefix + prompts[name]
+        if context is not None:
+            # 字幕はコンテキストにあるのでプロンプトだけを送る（字幕の分もクォータに数えるので枠は確保する）
+            return _llm_call("", backend, prompt, model=context[0], context_tokens=tokens)
+        return _llm_call(source, backend, prompt)
+
+    errors = {}
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency or len(pending)) as ex:
+            futures = {name: ex.submit(contextvars.copy_context().run, run, name) for name in pending}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    errors[name] = e
+    finally:
+        if context is not None:
+            try:
+                context[1]()
+            except Exception as e:
+                logger.warning(f"コンテキストキャッシュの削除に失敗: {str(e)}")
+
+    if use_cache:
+        for name in pending:
+            if name in results:
+                summary_cache().put(keys[name], results[name].encode("utf-8"))
+    fallback = None
+    for name, e in list(errors.items()):
+        fallback = fallback or _fallback(e, transcript)
+        if fallback is not None:
+            results[name] = fallback
+            del errors[name]
+    if errors:
+        failed = ", ".join(f"{name}: {str(e)}" for name, e in errors.items())
+        raise Exception(f"要約の生成に失敗しました: {failed}")
+    return {name: results[name] for name in prompts}
+
+def summarize_stream(transcript: list[dict], backend: Backend = Backend.GEMINI, prompt: str = None,
+                     use_cache: bool = True, mode: str = "auto",
+                     compact: bool = COMPACT_TRANSCRIPT) -> Iterator[str]:
+    """
+    summarize() のストリーミング版。要約テキストの差分を順に yield する
+    キャッシュにあれば全文を一度に返し、map-reduce では最後の統合だけを逐次返す
+    """
+    req = _prepare(transcript, backend, prompt, use_cache, mode, compact)
+    if req.ready is not None:
+        yield req.ready
+        return
+
+    parts = []
+    try:
+        text, prompt_used = req.text, req.prompt
+        if req.mode == "map_reduce":
+            try:
+                partials = _map_reduce_partials(req.transcript, backend, CHUNK_TOKENS, MAP_CONCURRENCY)
+            except Exception as e:
+                raise Exception(f"要約の生成に失敗しました: {str(e)}")
+            text, prompt_used = "\n\n".join(partials), f"{REDUCE_PROMPT}\n{req.prompt}"
+
+        for delta in generate_summary_stream_with_gemini(text, prompt_used):
+            parts.append(delta)
+            yield delta
+    except Exception as e:
+        # 途中まで出力していたら代替せずにそのまま失敗させる
+        if parts:
+            raise
+        yield _fallback_or_raise(e, req.transcript)
+        return
+
+    if req.key is not None:
+        summary_cache().put(req.key, "".join(parts).encode("utf-8"))
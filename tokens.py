@@ -0,0 +1,19 @@
+# tokens.py
+"""
+tiktoken のエンコーダを使い回すためのヘルパー
+（Gemini のトークン数そのものではなく、予算管理用の目安）
+"""
+from functools import lru_cache
+
+ENCODING = "cl100k_base"
+
+
+@lru_cache(maxsize=None)
+def get_encoder():
+    # tiktoken の読み込みは重いので最初に必要になったときだけ import する
+    import tiktoken
+    return tiktoken.get_encoding(ENCODING)
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoder().encode(text))
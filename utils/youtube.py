@@ -1,14 +1,91 @@
 from urllib.parse import urlparse, parse_qs
+import re
+
+# 動画・再生リスト・チャンネルの種別
+VIDEO, PLAYLIST, CHANNEL = "video", "playlist", "channel"
+
+_VIDEO_ID_RE = re.compile(r"^[0-9A-Za-z_-]{11}$")
+# /shorts/<id>, /live/<id>, /embed/<id>, /v/<id>
+_PATH_VIDEO_RE = re.compile(r"^/(?:shorts|live|embed|v)/([0-9A-Za-z_-]{11})")
+# /@handle, /channel/UC..., /c/name, /user/name（後ろに /videos などのタブが付くこともある）
+_CHANNEL_RE = re.compile(r"^/(@[^/]+|channel/[^/]+|c/[^/]+|user/[^/]+)(/[^/]+)?/?$")
+_CHANNEL_TABS = ("videos", "shorts", "streams")
+
 
 def parse_url(url: str) -> str:
     """
     どんな YouTube URL でも video_id を返す。
     - https://youtu.be/<id>
     - https://www.youtube.com/watch?v=<id>&t=5s
+    - https://www.youtube.com/shorts/<id>（/live/<id>, /embed/<id> も同様）
+    再生リスト・チャンネルの URL は ValueError（expand_url で動画に展開する）
+    """
+    kind, value = classify_url(url)
+    if kind != VIDEO:
+        raise ValueError("再生リスト・チャンネルの URL です。動画の URL を指定してください")
+    return value
+
+
+def classify_url(url: str) -> tuple[str, str]:
     """
-    parts = urlparse(url)
-    if parts.netloc in ("youtu.be", "www.youtu.be"):
-        return parts.path.lstrip("/")
-    if parts.netloc.endswith("youtube.com"):
-        return parse_qs(parts.query).get("v", [""])[0]
+    URL の種別と ID を返す: (VIDEO, video_id) / (PLAYLIST, list_id) / (CHANNEL, 正規化した URL)
+    v= と list= の両方がある watch URL は動画として扱う
+    """
+    parts = urlparse(url.strip())
+    host = parts.netloc.lower()
+    if host in ("youtu.be", "www.youtu.be"):
+        return VIDEO, parts.path.lstrip("/").split("/")[0]
+    if not host.endswith("youtube.com"):
+        raise ValueError("Invalid YouTube URL")
+
+    query = parse_qs(parts.query)
+    if query.get("v"):
+        return VIDEO, query["v"][0]
+    m = _PATH_VIDEO_RE.match(parts.path)
+    if m:
+        return VIDEO, m.group(1)
+    if query.get("list"):
+        return PLAYLIST, query["list"][0]
+    m = _CHANNEL_RE.match(parts.path)
+    if m:
+        tab = (m.group(2) or "").strip("/")
+        # タブ指定がなければ通常の動画一覧
+        tab = tab if tab in _CHANNEL_TABS else "videos"
+        return CHANNEL, f"https://www.youtube.com/{m.group(1)}/{tab}"
     raise ValueError("Invalid YouTube URL")
+
+
+def is_video_id(value: str) -> bool:
+    return bool(_VIDEO_ID_RE.match(value))
+
+
+def expand_url(url: str, limit: int | None = None) -> list[dict]:
+    """
+    再生リスト・チャンネルの URL を動画の一覧に展開する（動画の URL ならその1件）
+    yt-dlp のフラット抽出で一覧ページだけを読み、各動画のページは取得しない
+    戻り値: [{"video_id", "url", "title"}, ...]（一覧の順）
+    """
+    kind, value = classify_url(url)
+    if kind == VIDEO:
+        return [{"video_id": value, "url": f"https://youtu.be/{value}", "title": None}]
+    target = f"https://www.youtube.com/playlist?list={value}" if kind == PLAYLIST else value
+
+    # yt-dlp の import は重いので、展開が必要になったときだけ読み込む
+    import yt_dlp
+    opts = {"extract_flat": "in_playlist", "skip_download": True, "quiet": True, "no_warnings": True}
+    if limit:
+        opts["playlistend"] = limit
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(target, download=False)
+
+    videos, seen = [], set()
+    for entry in info.get("entries") or []:
+        vid = (entry or {}).get("id")
+        # 非公開・削除済みの動画や、入れ子の再生リストは飛ばす
+        if not vid or not is_video_id(vid) or vid in seen:
+            continue
+        seen.add(vid)
+        videos.append({"video_id": vid, "url": f"https://youtu.be/{vid}", "title": entry.get("title")})
+        if limit and len(videos) >= limit:
+            break
+    return videos
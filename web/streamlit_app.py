@@ -9,7 +9,8 @@ import json
 import logging
 import time
 from datetime import datetime
-import traceback  # 追加
+import functools
+import io
 
 # ロギングの設定
 logging.basicConfig(
@@ -32,9 +33,14 @@ def init_session_state():
 # Streamlit Cloudの場合は環境変数を直接使用
 os.getenv('STREAMLIT_CLOUD')
 # ── 既存ロジック ───────────────────────────────
-from main import run as pipeline_run  # run(url, method)
-from summarizer import summarize, Backend
-from utils.youtube import parse_url
+from main import run as pipeline_run, run_batch, expand_urls  # run(url, method)
+from summarizer import summarize_stream, summarize_many, get_model, Backend, answer
+from retrieval import format_hits
+from extractive import format_timestamp
+from utils.youtube import parse_url, classify_url, VIDEO
+from jobs import JobQueue
+import metrics
+import live
 
 # ── 要約プロンプト・プリセット ───────────────────
 PROMPT_PRESETS = {
@@ -87,10 +93,179 @@ def update_log(message, level="info"):
         logger.info(message)
         st.info(log_message)
 
+def timed_stream(stream, timings: dict):
+    """ストリームをそのまま流しつつ、最初の出力までの時間と全体の時間を記録する"""
+    started = time.perf_counter()
+    for delta in stream:
+        if "ttft" not in timings:
+            timings["ttft"] = time.perf_counter() - started
+        yield delta
+    timings["total"] = time.perf_counter() - started
+
+@st.cache_resource
+def load_model(backend: str):
+    """モデルはプロセス内で1度だけ生成し、再実行・セッションをまたいで共有する"""
+    return get_model(Backend(backend))
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    """全セッションで共有するジョブキュー"""
+    queue = JobQueue(max_workers=int(os.getenv("JOB_WORKERS", 4)))
+    metrics.register_collector(
+        lambda: ((f"yt_summarizer_jobs_{k}", {}, v) for k, v in queue.metrics().items())
+    )
+    return queue
+
+@st.cache_resource
+def start_metrics_server():
+    """METRICS_PORT が設定されていれば /metrics をプロセスで1度だけ公開する"""
+    if metrics.METRICS_PORT:
+        return metrics.start_http_server(metrics.METRICS_PORT)
+    return None
+
+def summarize_job(job, url: str, prompt: str, backend: Backend, use_cache: bool, live_mode: bool = False,
+                  extra_presets: tuple[str, ...] = ()) -> str:
+    """
+    ワーカースレッドで動く処理本体
+    Streamlit の API は呼ばず、途中経過は job に書き込んで画面側のポーリングで読む
+    extra_presets を指定すると、取得した字幕1つからそれらのプリセットの要約も同時に作る
+    """
+    with metrics.trace("web", url=url, wait=round(job.wait_time or 0, 3)):
+        job.stage = "字幕を取得中..."
+        # ライブ配信は字幕が伸びていくのでキャッシュを使わない
+        transcript = pipeline_run(url, "caption", use_cache=use_cache and not live_mode)
+        job.data["transcript"] = transcript
+
+        if live_mode:
+            job.stage = "新しい字幕を要約に反映中..."
+            state, added = live.refresh(parse_url(url), backend=backend, prompt=prompt, transcript=transcript)
+            job.data["live"] = {"added": added, "segments": state.segments, "updates": state.updates}
+            job.partial = state.summary
+            return job.partial
+
+        if extra_presets:
+            job.stage = f"{1 + len(extra_presets)} 種類の要約を同時に生成中..."
+            prompts = {"✏️ 入力したプロンプト": prompt, **{name: PROMPT_PRESETS[name] for name in extra_presets}}
+            started = time.perf_counter()
+            summaries = summarize_many(transcript, prompts, backend=backend, use_cache=use_cache)
+            job.data["summaries"] = summaries
+            job.data["timings"] = {"total": time.perf_counter() - started}
+            job.partial = summaries["✏️ 入力したプロンプト"]
+            return job.partial
+
+        job.stage = "要約を生成中..."
+        timings = {}
+        for delta in timed_stream(summarize_stream(transcript, backend=backend, prompt=prompt, use_cache=use_cache), timings):
+            job.partial += delta
+        job.data["timings"] = timings
+        metrics.annotate(ttft=round(timings.get("ttft", 0), 3))
+        if "ttft" in timings:
+            metrics.observe("yt_summarizer_time_to_first_token_seconds", timings["ttft"])
+        logger.info(f"time-to-first-token={timings.get('ttft', 0):.3f}s total={timings.get('total', 0):.3f}s")
+        return job.partial
+
+def playlist_job(job, url: str, prompt: str, backend: Backend, use_cache: bool, limit: int) -> list[dict]:
+    """
+    再生リスト・チャンネルの動画をまとめて要約する（字幕の取得を要約より先行させて並列に処理）
+    動画ごとの状態は job.data["videos"] に書き込み、画面側のポーリングで表示する
+    """
+    with metrics.trace("web_playlist", url=url):
+        job.stage = "動画の一覧を取得中..."
+        entries = [v for v in expand_urls([url], limit) if "error" not in v]
+        if not entries:
+            raise Exception("再生リスト・チャンネルに動画が見つかりませんでした")
+        videos = {v["url"]: {"title": v["title"] or v["video_id"], "status": "queued"} for v in entries}
+        job.data["videos"] = videos
+        records = {}
+
+        def progress(video_url: str, stage: str, rec: dict | None):
+            videos[video_url]["status"] = stage
+            if rec is not None:
+                records[video_url] = rec
+                job.stage = f"{len(records)}/{len(videos)} 本完了"
+
+        job.stage = f"0/{len(videos)} 本完了"
+        run_batch(list(videos), io.StringIO(), backend, prompt=prompt,
+                  fetch_workers=int(os.getenv("PLAYLIST_FETCH_WORKERS", 4)),
+                  summarize_workers=int(os.getenv("PLAYLIST_SUMMARIZE_WORKERS", 2)),
+                  use_cache=use_cache, progress=progress)
+        # 一覧の順に並べ直す
+        return [{**records[u], "title": videos[u]["title"]} for u in videos if u in records]
+
+PLAYLIST_STATUS = {
+    "queued": "⏳ 待機中",
+    "fetching": "📥 字幕を取得中",
+    "summarizing": "📝 要約中",
+    "ok": "✅ 完了",
+    "error": "⚠️ 失敗",
+}
+
+def show_playlist_progress(videos: dict):
+    """再生リストの動画ごとの進捗"""
+    done = sum(v["status"] in ("ok", "error") for v in videos.values())
+    st.progress(done / len(videos))
+    with st.expander("動画ごとの状況", expanded=False):
+        for v in videos.values():
+            st.write(f"{PLAYLIST_STATUS.get(v['status'], v['status'])} — {v['title']}")
+
+# 字幕の書き出し形式: (ボタン, 拡張子, MIME)
+TRANSCRIPT_EXPORTS = {
+    "json": ("⬇ transcript (.json)", "json", "application/json"),
+    "text": ("⬇ transcript (.txt)", "txt", "text/plain"),
+    "srt": ("⬇ transcript (.srt)", "srt", "application/x-subrip"),
+}
+TRANSCRIPT_PAGE_SIZES = (50, 100, 200)
+
+def transcript_export(job, fmt: str) -> bytes:
+    """
+    字幕を書き出したバイト列。ダウンロードボタンが押されたときに初めて作り、
+    ジョブに持たせておくので、同じジョブ・同じ形式の変換は1回だけ
+    """
+    exports = job.data.setdefault("exports", {})
+    if fmt not in exports:
+        transcript = job.data["transcript"]
+        if fmt == "json":
+            exports[fmt] = transcript.to_json(indent=2).encode("utf-8")
+        elif fmt == "srt":
+            exports[fmt] = transcript.to_srt().encode("utf-8")
+        else:
+            exports[fmt] = transcript.to_text().encode("utf-8")
+    return exports[fmt]
+
+def show_transcript(transcript, vid: str):
+    """
+    字幕のページ送り・検索付き表示
+    画面に送るのは1ページ分だけなので、長時間の動画でもページの大きさは変わらない
+    """
+    col_query, col_size = st.columns([4, 1])
+    with col_query:
+        query = st.text_input("🔍 字幕を検索", key=f"transcript_query_{vid}").strip()
+    with col_size:
+        page_size = st.selectbox("表示件数", TRANSCRIPT_PAGE_SIZES, key="transcript_page_size")
+    indices = transcript.find(query) if query else range(len(transcript))
+    if not indices:
+        st.caption("一致する字幕はありません")
+        return
+    pages = -(-len(indices) // page_size)
+    page = st.number_input(f"ページ（全 {pages} ページ・{len(indices):,} 件）", min_value=1, max_value=pages,
+                           value=1, key=f"transcript_page_{vid}_{query}_{page_size}")
+    shown = indices[(page - 1) * page_size:page * page_size]
+    st.dataframe(
+        {
+            "時刻": [format_timestamp(transcript.starts[i]) for i in shown],
+            "字幕": [transcript.text_at(i) for i in shown],
+            "リンク": [f"https://youtu.be/{vid}?t={int(transcript.starts[i])}" for i in shown],
+        },
+        hide_index=True,
+        width="stretch",
+        column_config={"リンク": st.column_config.LinkColumn("リンク", display_text="▶")},
+    )
+
 def reset_session():
     """セッション状態をリセットする関数"""
     st.session_state.processing = False
     st.session_state.last_processed = None
+    st.session_state.pop("job_id", None)
 
 # 環境変数のチェック
 if not os.getenv('GOOGLE_API_KEY'):
@@ -110,133 +285,241 @@ if "prompt" not in st.session_state or st.session_state.get("preset") != preset_
 prompt = st.text_area("📝 要約プロンプト (指示文だけ書く)",
                       value=st.session_state["prompt"], height=180)
 
-# ② バックエンド選択を削除し、常にGeminiを使用
-backend_enum = Backend.GEMINI
+# ② バックエンド選択（抽出型は LLM を使わず即座に要点だけを出す。プロンプトは使わない）
+BACKEND_LABELS = {
+    Backend.GEMINI: "Gemini（高品質）",
+    Backend.EXTRACTIVE: "抽出型（オフライン・即時）",
+}
+backend_enum = st.radio("🤖 要約方式", list(BACKEND_LABELS), format_func=BACKEND_LABELS.get, horizontal=True)
+load_model(backend_enum.value)
+start_metrics_server()
+
+use_cache = not st.checkbox("♻️ キャッシュを使わずに再取得・再要約する", value=False)
+live_mode = st.checkbox("🔴 ライブ配信・プレミア（前回以降に増えた字幕だけを要約に反映する）", value=False)
+# 字幕は1回だけ取得し、選んだプリセットの要約を並列に作る（ライブ配信・抽出型では使わない）
+extra_presets = ()
+if not live_mode and backend_enum != Backend.EXTRACTIVE:
+    extra_presets = tuple(st.multiselect("➕ 同時に出力するプリセット",
+                                         [name for name in PROMPT_PRESETS if name != preset_name]))
 
-# ③ 実行ボタン
-if st.button("▶ 要約する") and url:
+# 再生リスト・チャンネルの URL なら処理する本数を選ばせる
+try:
+    url_kind = classify_url(url)[0] if url else VIDEO
+except ValueError:
+    url_kind = VIDEO
+if url_kind != VIDEO:
+    playlist_limit = st.number_input("📚 再生リスト・チャンネルから要約する動画数（新しい順／リスト順）",
+                                     min_value=1, max_value=500, value=20)
+
+# ③ 実行ボタン（処理はプロセス共通のジョブキューで行い、この画面はポーリングで結果を待つ）
+run_clicked = st.button("▶ 要約する")
+if run_clicked and url and url_kind != VIDEO:
+    # 同じ再生リスト・同じ条件の処理が実行中なら相乗りする
+    key = ("playlist", url.strip(), int(playlist_limit), " ".join(prompt.split()), backend_enum.value, use_cache)
+    job = get_job_queue().submit(
+        key, functools.partial(playlist_job, url=url, prompt=prompt, backend=backend_enum,
+                               use_cache=use_cache, limit=int(playlist_limit))
+    )
+    st.session_state["job_id"] = job.id
+    st.session_state["vid"] = None
+    st.session_state.processing = True
+    update_log("再生リスト・チャンネルの処理を開始します...")
+elif run_clicked and url:
     try:
-        update_log("処理を開始します...")
+        vid = parse_url(url)
+    except ValueError as e:
+        st.error(f"エラーが発生しました: {str(e)}")
+    else:
+        # 同じ動画・同じプロンプトの処理が実行中なら相乗りする
+        key = (vid, " ".join(prompt.split()), backend_enum.value, use_cache, live_mode, extra_presets)
+        job = get_job_queue().submit(
+            key, functools.partial(summarize_job, url=url, prompt=prompt, backend=backend_enum,
+                                   use_cache=use_cache, live_mode=live_mode, extra_presets=extra_presets)
+        )
+        st.session_state["job_id"] = job.id
+        st.session_state["vid"] = vid
+        st.session_state.processing = True
+        if job.requesters > 1:
+            update_log("同じ動画の処理が進行中のため、その結果を待ちます...")
+        else:
+            update_log("処理を開始します...")
+
+# キューの状況
+queue_metrics = get_job_queue().metrics()
+st.sidebar.caption(
+    f"🧵 実行中 {queue_metrics['running']}/{queue_metrics['workers']} ・ 待機 {queue_metrics['queue_depth']} ・ "
+    f"平均待ち {queue_metrics['wait_avg']:.1f} 秒 (p95 {queue_metrics['wait_p95']:.1f} 秒)"
+)
+
+job = get_job_queue().get(st.session_state["job_id"]) if "job_id" in st.session_state else None
+
+if job is not None and not job.finished:
+    # 途中経過を表示して少し待ってから再実行（ポーリング）
+    st.info(f"⚙️ {job.stage or '順番待ち中...'}（待機中のジョブ: {queue_metrics['queue_depth']} 件）")
+    if "videos" in job.data:
+        show_playlist_progress(job.data["videos"])
+    if job.partial:
+        st.subheader("📝 要約")
+        st.markdown(job.partial)
+    time.sleep(0.5)
+    st.rerun()
+
+elif job is not None and job.status == "error":
+    st.session_state.processing = False
+    if "字幕の取得に失敗しました" in job.error:
+        st.error("""
+        ⚠️ 字幕の取得に失敗しました。以下の可能性があります：
+        1. この動画には字幕がありません
+        2. 字幕が無効になっています
+        3. アクセスが制限されています
         
-        with st.spinner("⚙️ 解析中…少し待ってね"):
-            # 1) 字幕 JSON 生成
-            update_log("動画の字幕を取得中...")
-            vid = parse_url(url)
-            
-            # 字幕取得
-            update_log("字幕を処理中...")
-            transcript = pipeline_run(url, "caption")
-            
-            # 字幕データをセッションに保存
-            st.session_state["transcript"] = transcript
-            
-            # 2) 要約生成
-            update_log("要約を生成中...")
-            summary = summarize(transcript, backend=backend_enum, prompt=prompt)
-            
-            # 要約をセッションに保存
-            st.session_state["summary"] = summary
-
-            # 3) 結果表示
-            update_log("処理が完了しました！", "info")
-            st.success("✅ 完了！")
-
-            # 要約セクション
-            st.subheader("📝 要約")
-            
-            # コピーボタンと要約テキストを横に並べる
-            col_copy, col_text = st.columns([1, 5])
-            with col_copy:
-                if st.button("📋 コピー", key="copy_summary"):
-                    st.write(f'<script>navigator.clipboard.writeText(`{summary}`)</script>', unsafe_allow_html=True)
-                    st.success("コピーしました！")
-            
-            # 要約テキストを表示（モバイル対応）
-            st.markdown(summary)
-
-            # 字幕セクション
-            st.subheader("📄 字幕 JSON")
-            
-            # コピーボタンとJSON表示を横に並べる
-            col_copy_json, col_json = st.columns([1, 5])
-            with col_copy_json:
-                if st.button("📋 コピー", key="copy_json"):
-                    json_str = json.dumps(transcript, ensure_ascii=False, indent=2)
-                    st.write(f'<script>navigator.clipboard.writeText(`{json_str}`)</script>', unsafe_allow_html=True)
-                    st.success("コピーしました！")
-            
-            # JSONを表示（モバイル対応）
-            with st.expander("クリックで表示 / コピー", expanded=True):
-                st.json(transcript)
-
-            # ダウンロードボタン（モバイル対応）
-            st.subheader("💾 ダウンロード")
-            col_dl1, col_dl2 = st.columns(2)
-            with col_dl1:
-                st.download_button(
-                    "⬇ transcript (.json)",
-                    json.dumps(transcript, ensure_ascii=False, indent=2).encode('utf-8'),
-                    file_name=f"{vid}.json",
-                    mime="application/json"
-                )
-            with col_dl2:
-                st.download_button(
-                    "⬇ summary (.md)",
-                    summary.encode('utf-8'),
-                    file_name=f"{vid}_summary.md",
-                    mime="text/markdown"
-                )
-
-            # シェアボタン（モバイル対応）
-            st.subheader("🔗 シェア")
-            share_url = f"https://youtu.be/{vid}"
-            st.markdown(f"""
-            <div style="display: flex; gap: 10px; margin-bottom: 20px;">
-                <a href="https://twitter.com/intent/tweet?url={share_url}&text=YouTube動画の要約" 
-                   target="_blank" 
-                   style="text-decoration: none; padding: 8px 16px; background-color: #1DA1F2; color: white; border-radius: 4px;">
-                    🐦 Twitterでシェア
-                </a>
-                <a href="https://www.facebook.com/sharer/sharer.php?u={share_url}" 
-                   target="_blank"
-                   style="text-decoration: none; padding: 8px 16px; background-color: #4267B2; color: white; border-radius: 4px;">
-                    👥 Facebookでシェア
-                </a>
-            </div>
-            """, unsafe_allow_html=True)
-
-            # モバイル対応のスタイル
-            st.markdown("""
-            <style>
-            @media (max-width: 768px) {
-                .stButton button {
-                    width: 100%;
-                    margin-bottom: 10px;
-                }
-                .stDownloadButton button {
-                    width: 100%;
-                    margin-bottom: 10px;
-                }
-            }
-            </style>
-            """, unsafe_allow_html=True)
-
-    except Exception as e:
-        error_message = str(e)
-        if "字幕の取得に失敗しました" in error_message:
-            st.error("""
-            ⚠️ 字幕の取得に失敗しました。以下の可能性があります：
-            1. この動画には字幕がありません
-            2. 字幕が無効になっています
-            3. アクセスが制限されています
-            
-            別の動画を試すか、しばらく時間をおいて再度お試しください。
-            """)
+        別の動画を試すか、しばらく時間をおいて再度お試しください。
+        """)
+    else:
+        st.error(f"エラーが発生しました: {job.error}")
+    # デバッグ情報を表示
+    st.error("デバッグ情報:")
+    st.code(job.error_detail)
+
+elif job is not None and "videos" in job.data:
+    # 再生リスト・チャンネルの結果（一覧の順）
+    st.session_state.processing = False
+    st.session_state.last_processed = url
+    records = job.result
+    ok = [r for r in records if r["status"] == "ok"]
+    st.success(f"✅ 完了！ {len(ok)}/{len(records)} 本を要約しました")
+    for rec in records:
+        if rec["status"] == "ok":
+            with st.expander(f"🎬 {rec['title']}"):
+                st.markdown(f"[動画を開く](https://youtu.be/{rec['video_id']})")
+                st.markdown(rec["summary"])
         else:
-            st.error(f"エラーが発生しました: {error_message}")
-        # デバッグ情報を表示
-        st.error("デバッグ情報:")
-        st.code(traceback.format_exc())
+            st.warning(f"⚠️ {rec['title']}: {rec.get('error')}")
+    st.download_button(
+        "⬇ summaries (.jsonl)",
+        "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8"),
+        file_name="summaries.jsonl",
+        mime="application/jsonl",
+    )
+
+elif job is not None:
+    vid = st.session_state["vid"]
+    transcript = job.data["transcript"]
+    summary = job.result
+    timings = job.data.get("timings", {})
+
+    # 結果をセッションに保存
+    st.session_state["transcript"] = transcript
+    st.session_state["summary"] = summary
+    st.session_state["timings"] = timings
+    st.session_state.processing = False
+    st.session_state.last_processed = vid
+
+    st.success("✅ 完了！")
+    if "live" in job.data:
+        live_info = job.data["live"]
+        st.caption(
+            f"🔴 差分要約: 今回 +{live_info['added']} セグメント / 累計 {live_info['segments']} セグメント・"
+            f"{live_info['updates']} 回更新（もう一度「要約する」で続きを反映）"
+        )
+    st.caption(
+        f"⏱ 待ち {job.wait_time or 0:.1f} 秒 / 最初の出力まで {timings.get('ttft', 0):.1f} 秒 / "
+        f"要約全体 {timings.get('total', 0):.1f} 秒"
+    )
+
+    # 要約セクション（複数プリセットならタブで切り替え）
+    st.subheader("📝 要約")
+    summaries = job.data.get("summaries")
+    if summaries:
+        for tab, (name, text) in zip(st.tabs(list(summaries)), summaries.items()):
+            with tab:
+                st.markdown(text)
+    else:
+        st.markdown(summary)
+
+    # コピーボタン
+    if st.button("📋 コピー", key="copy_summary"):
+        st.write(f'<script>navigator.clipboard.writeText(`{summary}`)</script>', unsafe_allow_html=True)
+        st.success("コピーしました！")
+
+    # 質問セクション（字幕全体ではなく、質問に関係する区間だけを LLM に送る）
+    st.subheader("❓ 動画に質問")
+    question = st.text_input("質問", key=f"question_{vid}", placeholder="例: 結論として何を勧めていましたか？")
+    if st.button("質問する", key="ask") and question:
+        with st.spinner("関連する箇所を探して回答を生成中..."):
+            try:
+                reply, hits = answer(transcript, question, backend=backend_enum, use_cache=use_cache)
+            except Exception as e:
+                st.error(f"エラーが発生しました: {str(e)}")
+            else:
+                st.session_state.setdefault("qa", {}).setdefault(vid, []).append((question, reply, hits))
+    for q, reply, hits in reversed(st.session_state.get("qa", {}).get(vid, [])):
+        st.markdown(f"**Q. {q}**")
+        st.markdown(reply)
+        if hits:
+            with st.expander("根拠にした箇所"):
+                st.text(format_hits(hits))
+
+    # 字幕セクション
+    st.subheader("📄 字幕")
+    with st.expander(f"クリックで表示（{len(transcript):,} セグメント）", expanded=False):
+        show_transcript(transcript, vid)
+
+    # ダウンロードボタン（中身はボタンが押されたときに作る）
+    st.subheader("💾 ダウンロード")
+    *cols_transcript, col_summary = st.columns(len(TRANSCRIPT_EXPORTS) + 1)
+    for col, (fmt, (label, ext, mime)) in zip(cols_transcript, TRANSCRIPT_EXPORTS.items()):
+        with col:
+            st.download_button(
+                label,
+                functools.partial(transcript_export, job, fmt),
+                file_name=f"{vid}.{ext}",
+                mime=mime,
+                on_click="ignore",
+                key=f"download_{fmt}",
+            )
+    with col_summary:
+        st.download_button(
+            "⬇ summary (.md)",
+            ("\n\n".join(f"## {name}\n\n{text}" for name, text in summaries.items()) if summaries
+             else summary).encode('utf-8'),
+            file_name=f"{vid}_summary.md",
+            mime="text/markdown"
+        )
+
+    # シェアボタン（モバイル対応）
+    st.subheader("🔗 シェア")
+    share_url = f"https://youtu.be/{vid}"
+    st.markdown(f"""
+    <div style="display: flex; gap: 10px; margin-bottom: 20px;">
+        <a href="https://twitter.com/intent/tweet?url={share_url}&text=YouTube動画の要約" 
+           target="_blank" 
+           style="text-decoration: none; padding: 8px 16px; background-color: #1DA1F2; color: white; border-radius: 4px;">
+            🐦 Twitterでシェア
+        </a>
+        <a href="https://www.facebook.com/sharer/sharer.php?u={share_url}" 
+           target="_blank"
+           style="text-decoration: none; padding: 8px 16px; background-color: #4267B2; color: white; border-radius: 4px;">
+            👥 Facebookでシェア
+        </a>
+    </div>
+    """, unsafe_allow_html=True)
+
+    # モバイル対応のスタイル
+    st.markdown("""
+    <style>
+    @media (max-width: 768px) {
+        .stButton button {
+            width: 100%;
+            margin-bottom: 10px;
+        }
+        .stDownloadButton button {
+            width: 100%;
+            margin-bottom: 10px;
+        }
+    }
+    </style>
+    """, unsafe_allow_html=True)
 
 # 処理状態の表示
 if st.session_state.processing:
@@ -246,4 +529,4 @@ if st.session_state.processing:
 if st.session_state.last_processed is not None:
     if st.button("🔄 新しい処理を開始"):
         reset_session()
-        st.experimental_rerun()
+        st.rerun()